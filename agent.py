@@ -1,13 +1,23 @@
 import os
 import json
+import logging
+import asyncio
 import hashlib
 import re
+import importlib.util
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import TypedDict
 from dotenv import load_dotenv
-import google.generativeai as genai
-from web3 import Web3
-import PyPDF2
+import orjson
+
+# Heavy SDKs (Gemini, web3, PDF backends) are imported on first use so
+# mock runs, --help and PDF worker processes start fast
 
 def _load_env():
     """Load environment variables from .env file"""
@@ -25,18 +35,198 @@ def _load_env():
 # Load environment variables
 _load_env()
 
-# Configure Gemini AI
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"))
+logger = logging.getLogger(__name__)
+
+class LineItem(TypedDict):
+    description: str
+    quantity: float
+    unit_price: str
+    total: str
+
+class InvoiceExtraction(TypedDict):
+    supplier_name: str
+    invoice_number: str
+    date: str
+    total_amount: str
+    currency: str
+    vat_amount: str
+    line_items: list[LineItem]
+    potential_issues: list[str]
+
+# Structured output: Gemini returns raw JSON matching InvoiceExtraction
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": InvoiceExtraction,
+}
+
+_genai = None
+_model = None
+
+def _get_genai():
+    """Import and configure the Gemini SDK once"""
+    global _genai
+    if _genai is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        _genai = genai
+    return _genai
+
+def _get_model():
+    """Shared Gemini model with structured JSON output"""
+    global _model
+    if _model is None:
+        _model = _get_genai().GenerativeModel(
+            os.getenv("GEMINI_MODEL", "gemini-2.0-flash"),
+            generation_config=GENERATION_CONFIG
+        )
+    return _model
+
+def _resolve_pdf_backend():
+    """Pick the fastest available PDF text backend"""
+    if shutil.which("pdftotext"):
+        return "pdftotext"
+    if importlib.util.find_spec("pypdfium2") is not None:
+        return "pypdfium2"
+    return "pymupdf"
+
+# Static part of the invoice extraction prompt
+INVOICE_INSTRUCTION = """Analyze this invoice and extract the following information in JSON format:
+- supplier_name
+- invoice_number
+- date
+- total_amount
+- currency
+- vat_amount
+- line_items (array of {description, quantity, unit_price, total})
+- potential_issues (array of any anomalies like: duplicate invoice numbers, unusual amounts, missing VAT, incorrect calculations)
+
+Return ONLY valid JSON."""
+
+# Offline invoice parsing patterns (compiled once)
+_RE_INV_NO = [
+    re.compile(p, re.IGNORECASE | re.MULTILINE) for p in (
+        r"(?:invoice\s*(?:number|no\.?|#)\s*[:\-]?\s*)([A-Za-z0-9\-\/]+)",
+        r"(?:inv(?:oice)?\s*#\s*[:\-]?\s*)([A-Za-z0-9\-\/]+)",
+    )
+]
+_RE_DATE = [
+    re.compile(p, re.IGNORECASE | re.MULTILINE) for p in (
+        r"(?:date\s*[:\-]?\s*)(\d{4}[\/\-]\d{1,2}[\/\-]\d{1,2})",
+        r"(?:date\s*[:\-]?\s*)(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})",
+    )
+]
+_RE_TOTAL = re.compile(r"\btotal\b", re.IGNORECASE)
+_RE_CUR = re.compile(r"\b(EUR|USD|GBP|RON|LEI|CHF|CAD|AUD|JPY)\b", re.IGNORECASE)
+_RE_AMT = re.compile(r"([0-9]{1,3}(?:[ ,][0-9]{3})*(?:[.,][0-9]{2})?)")
+
+# Prompt windowing: only header, footer and key-field lines go to Gemini
+PROMPT_HEAD_LINES = 60
+PROMPT_TAIL_LINES = 40
+_RE_PROMPT_KEEP = re.compile(r"\b(total|vat|invoice|date)\b", re.IGNORECASE)
+
+def _window(invoice_text, head=PROMPT_HEAD_LINES, tail=PROMPT_TAIL_LINES):
+    """Cut long invoice text to its first/last lines plus any key-field line, in order"""
+    lines = invoice_text.splitlines()
+    if len(lines) <= head + tail:
+        return invoice_text
+    
+    tail_start = len(lines) - tail
+    return "\n".join(
+        ln for i, ln in enumerate(lines)
+        if i < head or i >= tail_start or _RE_PROMPT_KEEP.search(ln)
+    )
+
+# Below this many pages the process pool costs more than it saves
+PARALLEL_PDF_MIN_PAGES = 4
+
+# Page-parallel PDF workers, started on the first long PDF and shared by
+# every agent (and orchestrator thread) in the process
+_pdf_pool = None
+_pdf_pool_lock = threading.Lock()
 
-# Web3 setup for BSC Testnet
-w3 = Web3(Web3.HTTPProvider(os.getenv('BSC_TESTNET_RPC')))
+def _get_pdf_pool():
+    """Shared process pool for page-parallel PDF extraction"""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            _pdf_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1)
+    return _pdf_pool
+
+def _extract_pages(source, start, stop):
+    """Extract text from pages [start, stop) (runs in a worker process);
+    source is pymupdf.open kwargs, so workers parse the caller's bytes"""
+    import pymupdf
+    with pymupdf.open(**source) as doc:
+        return [doc[i].get_text("text") for i in range(start, stop)]
+
+_w3 = None
+
+def _get_w3():
+    """Web3 client for BSC Testnet (keep-alive session: one TLS handshake per process)"""
+    global _w3
+    if _w3 is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+        from web3 import Web3
+        
+        session = requests.Session()
+        session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+        _w3 = Web3(Web3.HTTPProvider(
+            os.getenv('BSC_TESTNET_RPC'),
+            session=session,
+            request_kwargs={"timeout": 30}
+        ))
+    return _w3
+
+# Metadata length used for the second registerInvoice gas sample
+GAS_CALIBRATION_BYTES = 256
+
+# Concurrent send_raw_transaction calls in register_many
+BROADCAST_WORKERS = 8
+
+# BSC produces a block every ~3s; polling faster than that just burns RPCs
+RECEIPT_POLL_SECONDS = 3
+
+async def _wait_for_receipt_ws(ws_url, tx_hash, timeout):
+    """Wait for a receipt by checking once per new block (eth_subscribe newHeads)"""
+    from web3 import AsyncWeb3, WebSocketProvider
+    from web3.exceptions import TimeExhausted, TransactionNotFound
+    
+    async with AsyncWeb3(WebSocketProvider(ws_url)) as ws3:
+        async def _until_mined():
+            await ws3.eth.subscribe("newHeads")
+            # Check once up front in case it was mined before we subscribed
+            try:
+                return await ws3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                pass
+            async for _ in ws3.socket.process_subscriptions():
+                try:
+                    return await ws3.eth.get_transaction_receipt(tx_hash)
+                except TransactionNotFound:
+                    continue
+        
+        try:
+            return await asyncio.wait_for(_until_mined(), timeout)
+        except asyncio.TimeoutError:
+            raise TimeExhausted(f"Transaction {tx_hash.hex()} not mined after {timeout}s")
+
+def _to_bytes32(invoice_hash):
+    """Hex hash -> bytes32 (remove 0x if present, trim to 32 bytes)"""
+    clean_hash = invoice_hash.replace('0x', '')
+    if len(clean_hash) > 64:
+        clean_hash = clean_hash[:64]
+    return bytes.fromhex(clean_hash)
+
+def _compact_json(metadata):
+    """Compact JSON for on-chain metadata: every calldata byte costs gas"""
+    return orjson.dumps(metadata).decode()
 
 # Smart contract setup - DEPLOYED ON BSC TESTNET
 CONTRACT_ADDRESS = os.getenv('CONTRACT_ADDRESS', '0xfde796D7E133A61636eD51f1e2F145C35b28617b')
 
-# Full ABI from Remix compilation
-CONTRACT_ABI = [
+# Full ABI from Remix compilation (tuple: shared, never mutated)
+CONTRACT_ABI = (
     {
         "anonymous": False,
         "inputs": [
@@ -88,72 +278,177 @@ CONTRACT_ABI = [
         "stateMutability": "view",
         "type": "function"
     }
-]
+)
 
 class InvoiceAgent:
+    # Live-mode connectivity probe runs once per process, not per agent
+    _live_checked = False
+    
     def __init__(self, mock_mode=True):
         self.mock_mode = mock_mode
+        self._pdf_backend = _resolve_pdf_backend()
+        self._account = None
+        self._contract = None
+        self._fn_register = None
+        self._fn_verify = None
+        self._nonce = None
+        self._send_lock = threading.Lock()
+        self._gas_model = None
+        # Set when calibration failed, so later registrations use the
+        # default limit instead of retrying both estimates
+        self._gas_calibration_failed = False
         print("Invoice Verification Agent initialized")
         print(f"Mode: {'MOCK (no blockchain)' if mock_mode else 'LIVE (blockchain active)'}")
+    
+    @classmethod
+    def _ensure_live(cls):
+        """Report connection and wallet balance, on the first live transaction only"""
+        if cls._live_checked:
+            return
+        cls._live_checked = True
         
-        if not mock_mode:
-            print(f"Contract: {CONTRACT_ADDRESS}")
-            print(f"Network: BSC Testnet")
-            
-            # Verify connection
-            if w3.is_connected():
-                print(f"✓ Connected to BSC Testnet")
-                private_key = os.getenv('WALLET_PRIVATE_KEY')
-                if private_key:
-                    account = w3.eth.account.from_key(private_key)
-                    balance = w3.eth.get_balance(account.address)
-                    print(f"✓ Wallet: {account.address}")
-                    print(f"✓ Balance: {w3.from_wei(balance, 'ether')} tBNB")
-                else:
-                    print("⚠ Warning: WALLET_PRIVATE_KEY not set in .env")
+        logger.debug("Contract: %s (BSC Testnet)", CONTRACT_ADDRESS)
+        
+        # Verify connection
+        w3 = _get_w3()
+        if w3.is_connected():
+            logger.debug("Connected to BSC Testnet")
+            private_key = os.getenv('WALLET_PRIVATE_KEY')
+            if private_key:
+                account = w3.eth.account.from_key(private_key)
+                balance = w3.eth.get_balance(account.address)
+                logger.debug("Wallet: %s", account.address)
+                logger.debug("Balance: %s tBNB", w3.from_wei(balance, 'ether'))
             else:
-                print("✗ Failed to connect to BSC Testnet")
+                logger.warning("WALLET_PRIVATE_KEY not set in .env")
+        else:
+            logger.warning("Failed to connect to BSC Testnet")
+    
+    def _init_chain_state(self):
+        """Derive account, contract and starting nonce once per agent"""
+        private_key = os.getenv('WALLET_PRIVATE_KEY')
+        if not private_key:
+            return False
+        
+        w3 = _get_w3()
+        self._account = w3.eth.account.from_key(private_key)
+        self._contract = w3.eth.contract(address=w3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
+        # Resolve ABI entries once instead of on every contract.functions lookup
+        self._fn_register = self._contract.get_function_by_name("registerInvoice")
+        self._fn_verify = self._contract.get_function_by_name("verifyInvoice")
+        self._nonce = w3.eth.get_transaction_count(self._account.address)
+        return True
+        
+    def _prefetch_registration_state(self, account, hash_bytes):
+        """
+        Read everything registerInvoice needs in one JSON-RPC batch:
+        verifyInvoice, gas price and (if not cached) nonce
+        Returns (already_registered, gas_price)
+        """
+        w3 = _get_w3()
+        need_nonce = self._nonce is None
+        try:
+            with w3.batch_requests() as batch:
+                batch.add(self._fn_verify(hash_bytes))
+                batch.add(w3.eth.gas_price)
+                if need_nonce:
+                    batch.add(w3.eth.get_transaction_count(account.address))
+                responses = batch.execute()
+            
+            if need_nonce:
+                self._nonce = responses[2]
+            return responses[0], responses[1]
+        except Exception:
+            # One failing call sinks the whole batch; redo the reads
+            # individually so each gets its own fallback
+            pass
+        
+        try:
+            already_registered = self._fn_verify(hash_bytes).call()
+        except Exception:
+            # If check fails, continue anyway (contract might not have this function)
+            already_registered = False
+        
+        if need_nonce:
+            self._nonce = w3.eth.get_transaction_count(account.address)
+        return already_registered, w3.eth.gas_price
+    
+    def _calibrate_gas_model(self, account):
+        """
+        Fit registerInvoice gas as base + per_byte * len(metadata_json)
+        Two estimates against random (unregistered) hashes, done once
+        """
+        samples = []
+        for length in (0, GAS_CALIBRATION_BYTES):
+            samples.append(self._fn_register(
+                os.urandom(32),
+                "x" * length
+            ).estimate_gas({'from': account.address}))
+        
+        per_byte = max(samples[1] - samples[0], 0) / GAS_CALIBRATION_BYTES
+        self._gas_model = (samples[0], per_byte)
+        print(f"   Calibrated gas model: {samples[0]} + {per_byte:.1f}/byte")
+        
+    def _gas_limit_for(self, account, metadata_json, force_estimate=False):
+        """Gas limit for registerInvoice from the calibrated model (500k if
+        uncalibrated); a failed calibration is only retried on force_estimate"""
+        # Gas is near-linear in metadata length, so skip estimate_gas per call
+        if force_estimate or (self._gas_model is None and not self._gas_calibration_failed):
+            try:
+                self._calibrate_gas_model(account)
+                self._gas_calibration_failed = False
+            except Exception as gas_err:
+                self._gas_calibration_failed = True
+                print(f"⚠️  Gas estimation failed: {gas_err}")
+        
+        if self._gas_model is None:
+            # If estimation fails, use high default
+            gas_limit = 500000
+            print(f"   Using default gas limit: {gas_limit}")
+            return gas_limit
+        
+        base, per_byte = self._gas_model
+        gas_limit = int((base + per_byte * len(metadata_json.encode())) * 1.3)  # Add 30% buffer
+        print(f"   Gas limit from model: {gas_limit}")
+        return gas_limit
         
     def analyze_invoice_locally(self, invoice_text):
         """Heuristic/offline fallback when AI is unavailable"""
         text = invoice_text or ""
-        lines = [ln.strip() for ln in text.splitlines() if ln.strip()]
 
         def first_match(patterns):
             for pat in patterns:
-                m = re.search(pat, text, flags=re.IGNORECASE | re.MULTILINE)
+                m = pat.search(text)
                 if m:
                     return (m.group(1) or "").strip()
             return None
 
-        invoice_number = first_match([
-            r"(?:invoice\s*(?:number|no\.?|#)\s*[:\-]?\s*)([A-Za-z0-9\-\/]+)",
-            r"(?:inv(?:oice)?\s*#\s*[:\-]?\s*)([A-Za-z0-9\-\/]+)",
-        ])
-
-        date = first_match([
-            r"(?:date\s*[:\-]?\s*)(\d{4}[\/\-]\d{1,2}[\/\-]\d{1,2})",
-            r"(?:date\s*[:\-]?\s*)(\d{1,2}[\/\-]\d{1,2}[\/\-]\d{2,4})",
-        ])
+        invoice_number = first_match(_RE_INV_NO)
+        date = first_match(_RE_DATE)
 
+        # One walk finds both anchors: first non-empty line and first total line
+        supplier_name = None
         total_line = None
-        for ln in lines:
-            if re.search(r"\btotal\b", ln, flags=re.IGNORECASE):
+        for raw in text.splitlines():
+            ln = raw.strip()
+            if not ln:
+                continue
+            if supplier_name is None:
+                supplier_name = ln
+            if _RE_TOTAL.search(ln):
                 total_line = ln
                 break
 
         currency = None
         total_amount = None
         if total_line:
-            m_cur = re.search(r"\b(EUR|USD|GBP|RON|LEI|CHF|CAD|AUD|JPY)\b", total_line, flags=re.IGNORECASE)
+            m_cur = _RE_CUR.search(total_line)
             if m_cur:
                 currency = m_cur.group(1).upper()
-            m_amt = re.search(r"([0-9]{1,3}(?:[ ,][0-9]{3})*(?:[.,][0-9]{2})?)", total_line)
+            m_amt = _RE_AMT.search(total_line)
             if m_amt:
                 total_amount = m_amt.group(1).replace(" ", "")
 
-        supplier_name = lines[0] if lines else None
-
         potential_issues = []
         if not invoice_number:
             potential_issues.append("Could not extract invoice number (offline parsing).")
@@ -173,66 +468,100 @@ class InvoiceAgent:
             "potential_issues": potential_issues,
         }
 
-    def extract_text_from_pdf(self, pdf_path):
-        """Extract text from PDF invoice"""
+    def extract_text_from_pdf(self, pdf_path, pdf_bytes=None):
+        """Extract text from PDF invoice (parses pdf_bytes instead of re-reading if given)"""
         try:
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = ""
-                for page in reader.pages:
-                    text += page.extract_text()
-            return text
+            if self._pdf_backend == "pdftotext":
+                proc = subprocess.run(
+                    ["pdftotext", "-layout", "-q", pdf_path, "-"],
+                    capture_output=True,
+                    timeout=30
+                )
+                # Fall through to the Python backends if the binary chokes
+                if proc.returncode == 0:
+                    return proc.stdout.decode("utf-8", "ignore")
+            
+            if self._pdf_backend == "pypdfium2":
+                import pypdfium2 as pdfium
+                pdf = pdfium.PdfDocument(pdf_bytes if pdf_bytes is not None else pdf_path)
+                try:
+                    return "\n".join(page.get_textpage().get_text_range() for page in pdf)
+                finally:
+                    pdf.close()
+            
+            import pymupdf
+            source = {"stream": pdf_bytes} if pdf_bytes is not None else {"filename": pdf_path}
+            with pymupdf.open(**source) as doc:
+                page_count = doc.page_count
+                if page_count < PARALLEL_PDF_MIN_PAGES:
+                    return chr(12).join(page.get_text("text") for page in doc)
+            
+            # Long invoices: parse pages in parallel, off the GIL; one
+            # contiguous page range per worker, so the bytes ship once each
+            chunks = min(os.cpu_count() or 1, page_count)
+            bounds = [page_count * k // chunks for k in range(chunks + 1)]
+            futures = [
+                _get_pdf_pool().submit(_extract_pages, source, start, stop)
+                for start, stop in zip(bounds, bounds[1:])
+            ]
+            return chr(12).join(text for future in futures for text in future.result())
         except Exception as e:
             return f"Error reading PDF: {str(e)}"
     
-    def analyze_invoice_with_ai(self, invoice_text):
-        """Use Gemini AI to extract structured data from invoice"""
-        prompt = f"""
-        Analyze this invoice and extract the following information in JSON format:
-        - supplier_name
-        - invoice_number
-        - date
-        - total_amount
-        - currency
-        - vat_amount
-        - line_items (array of {{description, quantity, unit_price, total}})
-        - potential_issues (array of any anomalies like: duplicate invoice numbers, unusual amounts, missing VAT, incorrect calculations)
-        
-        Invoice text:
-        {invoice_text}
-        
-        Return ONLY valid JSON, no additional text.
+    def extract_text_and_hash(self, pdf_path):
         """
+        Read the PDF once: hash its bytes and extract text from the same buffer
+        Returns (text, sha256 hex); the hash is None if the file can't be read
+        """
+        try:
+            with open(pdf_path, "rb") as f:
+                pdf_bytes = f.read()
+        except OSError as e:
+            return f"Error reading PDF: {str(e)}", None
         
+        return self.extract_text_from_pdf(pdf_path, pdf_bytes), hashlib.sha256(pdf_bytes).hexdigest()
+    
+    def _build_invoice_prompt(self, invoice_text):
+        """Full extraction prompt: instruction + windowed invoice text"""
+        return f"{INVOICE_INSTRUCTION}\n\nInvoice text:\n{_window(invoice_text)}"
+    
+    def _offline_fallback(self, invoice_text, error):
+        """Offline analysis annotated with why the AI path failed"""
+        fallback = self.analyze_invoice_locally(invoice_text)
+        msg = str(error).replace("\n", " ").strip()
+        msg = (msg[:160] + "...") if len(msg) > 160 else msg
+        fallback.setdefault("potential_issues", [])
+        fallback["potential_issues"].insert(0, f"AI unavailable; used offline parsing. ({type(error).__name__}: {msg})")
+        return fallback
+    
+    def analyze_invoice_with_ai(self, invoice_text):
+        """Use Gemini AI to extract structured data from invoice"""
         try:
-            response = model.generate_content(prompt)
-            result = response.text.strip()
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-            result = result.strip()
-            
-            return json.loads(result)
+            response = _get_model().generate_content(self._build_invoice_prompt(invoice_text))
+            return json.loads(response.text)
         except Exception as e:
-            fallback = self.analyze_invoice_locally(invoice_text)
-            msg = str(e).replace("\n", " ").strip()
-            msg = (msg[:160] + "...") if len(msg) > 160 else msg
-            fallback.setdefault("potential_issues", [])
-            fallback["potential_issues"].insert(0, f"AI unavailable; used offline parsing. ({type(e).__name__}: {msg})")
-            return fallback
+            return self._offline_fallback(invoice_text, e)
     
-    def calculate_hash(self, invoice_text):
-        """Calculate SHA-256 hash of invoice"""
-        return hashlib.sha256(invoice_text.encode()).hexdigest()
+    def _wait_for_receipt(self, tx_hash, timeout=120):
+        """Wait for a mined receipt, via WebSocket newHeads if BSC_TESTNET_WS is set"""
+        ws_url = os.getenv("BSC_TESTNET_WS")
+        if ws_url:
+            from web3.exceptions import TimeExhausted
+            try:
+                return asyncio.run(_wait_for_receipt_ws(ws_url, tx_hash, timeout))
+            except TimeExhausted:
+                raise
+            except Exception as ws_err:
+                print(f"⚠️  WebSocket receipt wait failed: {ws_err}")
+                print("   Falling back to HTTP polling")
+        
+        return _get_w3().eth.wait_for_transaction_receipt(tx_hash, timeout=timeout, poll_latency=RECEIPT_POLL_SECONDS)
     
-    def register_onchain(self, invoice_hash, metadata):
+    def register_onchain(self, invoice_hash, metadata, force_estimate=False):
         """Register invoice hash on BSC blockchain"""
         if self.mock_mode:
             # Mock blockchain registration
-            mock_tx_hash = f"0x{''.join([format(ord(c), 'x') for c in invoice_hash[:32]])}"
+            mock_tx_hash = "0x" + invoice_hash[:32].encode("ascii").hex()
             print("\n🔷 MOCK TRANSACTION")
             print(f"   Hash: {mock_tx_hash}")
             print(f"   Network: BSC Testnet (SIMULATED)")
@@ -240,73 +569,57 @@ class InvoiceAgent:
             return mock_tx_hash
         
         try:
-            # Real blockchain transaction
-            private_key = os.getenv('WALLET_PRIVATE_KEY')
-            if not private_key:
-                print("\n✗ Error: WALLET_PRIVATE_KEY not set in .env file")
-                return None
+            # Nonce read -> send -> increment is one critical section so
+            # concurrent callers never reuse a nonce; the receipt wait is not
+            with self._send_lock:
+                # Real blockchain transaction
+                self._ensure_live()
+                if self._account is None and not self._init_chain_state():
+                    print("\n✗ Error: WALLET_PRIVATE_KEY not set in .env file")
+                    return None
                 
-            account = w3.eth.account.from_key(private_key)
-            contract = w3.eth.contract(address=Web3.to_checksum_address(CONTRACT_ADDRESS), abi=CONTRACT_ABI)
-            
-            # Convert hash to bytes32 (remove 0x if present, pad/trim to 32 bytes)
-            clean_hash = invoice_hash.replace('0x', '')
-            if len(clean_hash) > 64:
-                clean_hash = clean_hash[:64]
-            hash_bytes = bytes.fromhex(clean_hash)
-            
-            # Check if invoice already registered
-            try:
-                already_registered = contract.functions.verifyInvoice(hash_bytes).call()
+                w3 = _get_w3()
+                account = self._account
+                
+                hash_bytes = _to_bytes32(invoice_hash)
+                metadata_json = _compact_json(metadata)
+                register_args = [hash_bytes, metadata_json]
+                already_registered, gas_price = self._prefetch_registration_state(
+                    account, hash_bytes
+                )
+                
+                # Check if invoice already registered
                 if already_registered:
                     print(f"\n⚠️  WARNING: Invoice already registered on blockchain!")
                     print(f"   Hash: {invoice_hash}")
                     print(f"   Try with a different invoice to test.")
                     return None
-            except Exception as check_err:
-                # If check fails, continue anyway (contract might not have this function)
-                pass
-            
-            # Estimate gas dynamically
-            try:
-                gas_estimate = contract.functions.registerInvoice(
-                    hash_bytes,
-                    json.dumps(metadata)
-                ).estimate_gas({'from': account.address})
                 
-                gas_limit = int(gas_estimate * 1.5)  # Add 50% buffer
-                print(f"   Estimated gas: {gas_estimate}, using: {gas_limit}")
-            except Exception as gas_err:
-                # If estimation fails, use high default
-                gas_limit = 500000
-                print(f"⚠️  Gas estimation failed: {gas_err}")
-                print(f"   Using default gas limit: {gas_limit}")
-            
-            # Build transaction
-            txn = contract.functions.registerInvoice(
-                hash_bytes,
-                json.dumps(metadata)
-            ).build_transaction({
-                'from': account.address,
-                'nonce': w3.eth.get_transaction_count(account.address),
-                'gas': gas_limit,
-                'gasPrice': w3.eth.gas_price
-            })
-            
-            # Sign and send
-            print("\n🔄 Signing transaction...")
-            signed_txn = w3.eth.account.sign_transaction(txn, private_key)
-            
-            print("📤 Broadcasting to BSC Testnet...")
-            tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            
+                gas_limit = self._gas_limit_for(account, metadata_json, force_estimate)
+                
+                # Build transaction
+                txn = self._fn_register(*register_args).build_transaction({
+                    'from': account.address,
+                    'nonce': self._nonce,
+                    'gas': gas_limit,
+                    'gasPrice': gas_price
+                })
+                
+                # Sign and send
+                print("\n🔄 Signing transaction...")
+                signed_txn = account.sign_transaction(txn)
+                
+                print("📤 Broadcasting to BSC Testnet...")
+                tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+                self._nonce += 1
+                
             print("\n✅ REAL TRANSACTION SENT!")
             print(f"   Hash: {tx_hash.hex()}")
             print(f"   Explorer: https://testnet.bscscan.com/tx/{tx_hash.hex()}")
             print(f"   Waiting for confirmation...")
             
             # Wait for receipt
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            receipt = self._wait_for_receipt(tx_hash, timeout=120)
             
             if receipt['status'] == 1:
                 print(f"✅ Transaction confirmed in block {receipt['blockNumber']}")
@@ -316,18 +629,139 @@ class InvoiceAgent:
             return tx_hash.hex()
             
         except Exception as e:
+            # Nonce may be out of sync now; re-read it from chain next time
+            self._nonce = None
             print(f"\n✗ Blockchain error: {str(e)}")
             return None
     
+    def register_many(self, invoice_hashes, metadatas):
+        """
+        Register several invoices without waiting between them:
+        nonces are assigned ahead, all txs signed locally, broadcast
+        concurrently, then confirmed in one pass
+        Returns tx hashes aligned with invoice_hashes (None = skipped/failed)
+        """
+        if self.mock_mode:
+            return [self.register_onchain(h, m) for h, m in zip(invoice_hashes, metadatas)]
+        
+        results = [None] * len(invoice_hashes)
+        try:
+            # Nonce assignment and broadcast share register_onchain's lock,
+            # so the two never hand out the same nonce
+            with self._send_lock:
+                self._ensure_live()
+                if self._account is None and not self._init_chain_state():
+                    print("\n✗ Error: WALLET_PRIVATE_KEY not set in .env file")
+                    return results
+                
+                w3 = _get_w3()
+                account = self._account
+                hashes_bytes = [_to_bytes32(h) for h in invoice_hashes]
+                
+                already_registered, gas_price, chain_nonce = self._prefetch_batch_state(
+                    account, hashes_bytes
+                )
+                nonce = max(chain_nonce, self._nonce or 0)
+                
+                # Sign everything up front (CPU only), nonce-ahead
+                pending = []
+                for i, (hash_bytes, metadata) in enumerate(zip(hashes_bytes, metadatas)):
+                    if already_registered[i]:
+                        print(f"⚠️  Skipping {invoice_hashes[i][:16]}...: already registered")
+                        continue
+                    metadata_json = _compact_json(metadata)
+                    txn = self._fn_register(hash_bytes, metadata_json).build_transaction({
+                        'from': account.address,
+                        'nonce': nonce,
+                        'gas': self._gas_limit_for(account, metadata_json),
+                        'gasPrice': gas_price
+                    })
+                    pending.append((i, account.sign_transaction(txn)))
+                    nonce += 1
+                self._nonce = nonce
+                
+                print(f"\n📤 Broadcasting {len(pending)} transaction(s) to BSC Testnet...")
+                with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as ex:
+                    futures = [
+                        (i, ex.submit(w3.eth.send_raw_transaction, signed.raw_transaction))
+                        for i, signed in pending
+                    ]
+                
+                sent = []
+                for i, fut in futures:
+                    try:
+                        sent.append((i, fut.result()))
+                    except Exception as send_err:
+                        # A gap in the nonce sequence; resync before the next send
+                        self._nonce = None
+                        print(f"✗ Broadcast failed for {invoice_hashes[i][:16]}...: {send_err}")
+        
+        except Exception as e:
+            self._nonce = None
+            print(f"\n✗ Blockchain error: {str(e)}")
+            return results
+        
+        # Sent transactions keep their hash even if confirmation fails
+        for i, tx_hash in sent:
+            results[i] = tx_hash.hex()
+            try:
+                receipt = self._wait_for_receipt(tx_hash, timeout=120)
+            except Exception as receipt_err:
+                print(f"⚠️  {tx_hash.hex()} not confirmed: {receipt_err}")
+                continue
+            if receipt['status'] == 1:
+                print(f"✅ {tx_hash.hex()} confirmed in block {receipt['blockNumber']}")
+            else:
+                print(f"✗ {tx_hash.hex()} failed")
+        
+        return results
+    
+    def _prefetch_batch_state(self, account, hashes_bytes):
+        """
+        verifyInvoice for every hash plus gas price and nonce in one
+        JSON-RPC batch; sequential if the endpoint rejects batches
+        Returns (already_registered list, gas_price, chain_nonce)
+        """
+        w3 = _get_w3()
+        try:
+            with w3.batch_requests() as batch:
+                for hash_bytes in hashes_bytes:
+                    batch.add(self._fn_verify(hash_bytes))
+                batch.add(w3.eth.gas_price)
+                batch.add(w3.eth.get_transaction_count(account.address))
+                responses = batch.execute()
+            gas_price, chain_nonce = responses[len(hashes_bytes):]
+            return list(responses[:len(hashes_bytes)]), gas_price, chain_nonce
+        except Exception:
+            # One failing call sinks the whole batch; redo the reads
+            # individually so each gets its own fallback
+            pass
+        
+        already_registered = []
+        for hash_bytes in hashes_bytes:
+            try:
+                already_registered.append(self._fn_verify(hash_bytes).call())
+            except Exception:
+                # Same as register_onchain: continue if the check fails
+                already_registered.append(False)
+        return already_registered, w3.eth.gas_price, w3.eth.get_transaction_count(account.address)
+    
     def process_invoice(self, invoice_path):
         """Main function to process invoice end-to-end"""
+        fields = self.extract_fields(invoice_path)
+        if fields is None:
+            return None
+        return self.submit_and_wait(invoice_path, *fields)
+    
+    def extract_fields(self, invoice_path):
+        """Steps 1-3 (text, AI fields, hash); (analysis, doc_hash) or None"""
         print(f"\n{'='*60}")
         print(f"Processing Invoice: {os.path.basename(invoice_path)}")
         print(f"{'='*60}")
         
         # Step 1: Extract text
         print("\n[1/4] Extracting text from invoice...")
-        invoice_text = self.extract_text_from_pdf(invoice_path)
+        invoice_text, doc_hash = self.extract_text_and_hash(invoice_path)
         if "Error" in invoice_text:
             print(f"✗ ERROR: {invoice_text}")
             return
@@ -348,26 +782,63 @@ class InvoiceAgent:
         print(f"   Total: {analysis.get('total_amount', 'N/A')} {analysis.get('currency', '')}")
         
         if analysis.get('potential_issues'):
-            print("\n⚠ Potential Issues:")
-            for issue in analysis['potential_issues']:
-                print(f"   - {issue}")
+            # One write for the whole list (this runs in orchestrator worker threads)
+            print("\n⚠ Potential Issues:\n" + "\n".join(
+                f"   - {issue}" for issue in analysis['potential_issues']
+            ))
         
-        # Step 3: Calculate hash
+        # Step 3: Document hash (computed from the bytes read in step 1)
         print("\n[3/4] Calculating document hash...")
-        doc_hash = self.calculate_hash(invoice_text)
         print(f"✓ Hash: {doc_hash[:16]}...{doc_hash[-16:]}")
-        
+        return analysis, doc_hash
+    
+    def submit_and_wait(self, invoice_path, analysis, doc_hash):
+        """Step 4: register onchain and wait for the receipt; result or None"""
         # Step 4: Register onchain
         print("\n[4/4] Registering on blockchain...")
-        metadata = {
+        # One clock read shared by the metadata and result
+        now = datetime.now()
+        tx_hash = self.register_onchain(doc_hash, self._registration_metadata(analysis, now))
+        return self._save_result(invoice_path, analysis, doc_hash, tx_hash, now)
+    
+    def process_invoices(self, invoice_paths):
+        """
+        Steps 1-3 per invoice, then one register_many for all of them, so
+        the registrations are broadcast together instead of each waiting
+        for the previous receipt
+        Returns results aligned with invoice_paths (None = failed)
+        """
+        extracted = []
+        for i, invoice_path in enumerate(invoice_paths):
+            fields = self.extract_fields(invoice_path)
+            if fields is not None:
+                extracted.append((i, invoice_path) + fields)
+        
+        results = [None] * len(invoice_paths)
+        if not extracted:
+            return results
+        
+        print(f"\n[4/4] Registering {len(extracted)} invoice(s) on blockchain...")
+        now = datetime.now()
+        tx_hashes = self.register_many(
+            [doc_hash for _, _, _, doc_hash in extracted],
+            [self._registration_metadata(analysis, now) for _, _, analysis, _ in extracted]
+        )
+        for (i, invoice_path, analysis, doc_hash), tx_hash in zip(extracted, tx_hashes):
+            results[i] = self._save_result(invoice_path, analysis, doc_hash, tx_hash, now)
+        return results
+    
+    def _registration_metadata(self, analysis, now):
+        """On-chain metadata for one invoice"""
+        return {
             "supplier": analysis.get('supplier_name'),
             "invoice_number": analysis.get('invoice_number'),
             "total": analysis.get('total_amount'),
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now  # orjson emits ISO 8601 directly
         }
-        
-        tx_hash = self.register_onchain(doc_hash, metadata)
-        
+    
+    def _save_result(self, invoice_path, analysis, doc_hash, tx_hash, now):
+        """Write the result file for a registered invoice; result or None"""
         if tx_hash:
             print(f"\n{'='*60}")
             print("✅ SUCCESS! Invoice verified and registered")
@@ -381,13 +852,15 @@ class InvoiceAgent:
                 "contract_address": CONTRACT_ADDRESS if not self.mock_mode else "MOCK_MODE",
                 "network": "BSC Testnet",
                 "analysis": analysis,
-                "timestamp": datetime.now().isoformat(),
+                "timestamp": now.isoformat(),
                 "mode": "LIVE" if not self.mock_mode else "MOCK"
             }
             
-            result_file = f"result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-            with open(result_file, 'w') as f:
-                json.dump(result, f, indent=2)
+            # Nanosecond stamp: concurrent/--jobs invoices finishing in the
+            # same second no longer overwrite each other's file
+            result_file = f"result_{time.time_ns()}.json"
+            with open(result_file, 'wb') as f:
+                f.write(orjson.dumps(result, option=orjson.OPT_INDENT_2))
             
             print(f"\n📄 Full results saved to: {result_file}")
             return result
@@ -1,16 +1,66 @@
 import os
 import json
+import asyncio
+import hashlib
+import math
+import re
+import sqlite3
+import time
 from datetime import datetime, timedelta
 from collections import defaultdict
 from dotenv import load_dotenv
-import google.generativeai as genai
-import statistics
+import numpy as np
+import orjson
+
+import invoice_db
 
 load_dotenv()
 
-# Configure AI
-genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"))
+# Gemini is imported and configured on first use, so the rule checks (and
+# the tests) run without the SDK. It keeps one gRPC client (and HTTP/2
+# channel) per service once configured, so every agent shares this model's
+# connection
+_model = None
+
+
+def _get_model():
+    """Shared Gemini model, created on first use"""
+    global _model
+    if _model is None:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+        _model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"))
+    return _model
+
+# Max concurrent Gemini requests in analyze_invoices_batch
+AI_CONCURRENCY = 8
+
+# Only these DB fields feed the fraud checks; records are slimmed to them
+DB_FIELDS = ('invoice_number', 'supplier_name', 'total_amount', 'timestamp', 'flags')
+_DB_QUERY = f"SELECT {', '.join(DB_FIELDS)} FROM invoices ORDER BY id"
+
+# Local cache of AI verdicts, keyed on invoice content + detected issues
+AI_CACHE_FILE = "ai_cache.db"
+AI_CACHE_TTL_SECONDS = 7 * 86400
+
+# Append-only report history, one compact JSON object per line
+REPORT_LOG_FILE = "fraud_analyses.ndjson"
+_report_log = None
+
+
+def _append_report(report):
+    """Append a report to the NDJSON log (file opened once per process)."""
+    global _report_log
+    if _report_log is None:
+        _report_log = open(REPORT_LOG_FILE, 'ab', buffering=0)
+    _report_log.write(orjson.dumps(
+        report, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+    ))
+
+_NUM_RE = re.compile(r"[-]?\d+\.?\d*")
+# Thousands separators and spaces, removed in one pass
+_STRIP_CHARS = str.maketrans('', '', ', ')
+
 
 def _safe_float(val, default=0.0):
     """Convert to float; return default for placeholders/invalid values."""
@@ -18,10 +68,11 @@ def _safe_float(val, default=0.0):
         return default
     if isinstance(val, (int, float)):
         return float(val)
-    s = str(val).strip().replace(",", "").replace(" ", "")
+    # Strings always go through the regex: float() would also accept
+    # forms like "1e5" or "1_000" that it reads differently
+    s = str(val).translate(_STRIP_CHARS).strip()
     # Strip leading currency/symbols, keep digits and one decimal
-    import re
-    m = re.search(r"[-]?\d+\.?\d*", s)
+    m = _NUM_RE.search(s)
     if not m:
         return default
     try:
@@ -30,75 +81,197 @@ def _safe_float(val, default=0.0):
         return default
 
 
+def _supplier_key(name):
+    """Lowercased supplier name used as the index key (computed once per record)."""
+    return (name or '').lower()
+
+
+def _parse_epoch(timestamp):
+    """ISO timestamp -> epoch seconds; NaN (fails every date window) if
+    missing or unparseable, so checks need no per-record handling."""
+    try:
+        return datetime.fromisoformat(timestamp).timestamp()
+    except (TypeError, ValueError):
+        return math.nan
+
+
+ROUND_NONE, ROUND_HUNDREDS, ROUND_THOUSANDS = 0, 1, 2
+
+
+def _round_tiers(amounts):
+    """Round-number tier per amount, as integer-cent column ops:
+    multiples of 1000 above 1000, multiples of 100 strictly between 100 and 1000."""
+    cents = np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+    tiers = np.full(cents.shape, ROUND_NONE, dtype=np.int8)
+    tiers[(cents > 10000) & (cents < 100000) & (cents % 10000 == 0)] = ROUND_HUNDREDS
+    tiers[(cents > 100000) & (cents % 100000 == 0)] = ROUND_THOUSANDS
+    return tiers
+
+
+def _strip_empty(invoice):
+    """Drop null/placeholder fields that only add prompt tokens."""
+    return {k: v for k, v in invoice.items() if v not in (None, '', 'N/A', [], {})}
+
+
+def _compact_json(obj):
+    """Prompt-sized JSON: no indentation or padding."""
+    return json.dumps(obj, separators=(',', ':'), default=str)
+
+
+def _ai_cache_key(invoice, detected_issues):
+    """Stable BLAKE2b digest of the canonical invoice + issues JSON."""
+    payload = (
+        json.dumps(invoice, sort_keys=True).encode()
+        + json.dumps(detected_issues, sort_keys=True).encode()
+    )
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
 class FraudDetectionAgent:
     def __init__(self):
         self.invoices_db = []
+        self._db_path = None
+        self._db_conn = None
+        self._db_version = None
         self.risk_scores = {}
+        self._reset_indexes()
+        self._finalize_indexes()
+        self._ai_cache = None
+        self.ai_cache_hits = 0
+        self.ai_cache_misses = 0
         self.fraud_patterns = []
         print("Fraud Detection & Risk Scoring Agent initialized")
         
-    def load_invoices_database(self, db_file="invoices_db.json"):
-        """Load all processed invoices"""
-        try:
-            with open(db_file, 'r') as f:
-                self.invoices_db = json.load(f)
+    @property
+    def model(self):
+        """Shared model: its sync and async gRPC clients are created on
+        first use and reused for every later call"""
+        return _get_model()
+    
+    def load_invoices_database(self, db_file=invoice_db.DB_FILE):
+        """Load all processed invoices (reread only when the DB changes)"""
+        if db_file != self._db_path:
+            self._db_conn = invoice_db.connect(db_file)
+            self._db_path = db_file
+            self._db_version = None
+        
+        # data_version moves whenever another connection commits
+        version = self._db_conn.execute("PRAGMA data_version").fetchone()[0]
+        if version == self._db_version:
+            print(f"Using cached database ({len(self.invoices_db)} invoices)")
+            return
+        
+        self.invoices_db = []
+        self._reset_indexes()
+        # Rows are indexed as the cursor yields them; only the fields the
+        # checks use are selected
+        for row in self._db_conn.execute(_DB_QUERY):
+            record = invoice_db.row_to_dict(row)
+            self.invoices_db.append(record)
+            self._index_invoice(record)
+        
+        if self.invoices_db:
             print(f"Loaded {len(self.invoices_db)} invoices from database")
-        except FileNotFoundError:
-            print("No invoice database found. Will analyze uploaded invoices only.")
-            self.invoices_db = []
+        else:
+            print("No invoices in database yet. Will analyze uploaded invoices only.")
+        self._db_version = version
+        self._finalize_indexes()
+    
+    def _reset_indexes(self):
+        """Empty blocking indexes: by invoice number, supplier and
+        supplier+amount, so each check only touches candidate invoices."""
+        self.by_invoice_num = defaultdict(list)
+        self.by_supplier = defaultdict(list)
+        self.by_supplier_amount = defaultdict(list)
+        # Memoized supplier scores are only valid for the DB they came from
+        self.risk_scores.clear()
+    
+    def _index_invoice(self, inv):
+        """Add one DB record to the indexes (timestamp parsed once here)"""
+        supplier = _supplier_key(inv.get('supplier_name'))
+        amount = _safe_float(inv.get('total_amount'))
+        # Entries are (epoch, amount, record)
+        entry = (_parse_epoch(inv.get('timestamp')), amount, inv)
+        
+        self.by_invoice_num[inv.get('invoice_number')].append(inv)
+        self.by_supplier[supplier].append(entry)
+        self.by_supplier_amount[(supplier, round(amount, 2))].append(entry)
+    
+    def _finalize_indexes(self):
+        """Build the per-supplier NumPy arrays once all records are indexed"""
+        self.supplier_amounts = {}
+        self.supplier_epochs = {}
+        for supplier in self.by_supplier:
+            self._finalize_supplier(supplier)
+    
+    def _finalize_supplier(self, supplier):
+        """(Re)build one supplier's arrays for the risk-score statistics
+        (epochs sorted)"""
+        entries = self.by_supplier[supplier]
+        self.supplier_amounts[supplier] = np.array([amount for _, amount, _ in entries], dtype=np.float64)
+        epochs = np.array([epoch for epoch, _, _ in entries], dtype=np.float64)
+        self.supplier_epochs[supplier] = np.sort(epochs[np.isfinite(epochs)])
     
     def detect_duplicate_invoices(self, invoice):
         """Detect potential duplicate invoices"""
         duplicates = []
         
-        supplier = invoice.get('supplier_name', '').lower()
+        supplier = _supplier_key(invoice.get('supplier_name'))
         amount = _safe_float(invoice.get('total_amount'))
         invoice_num = invoice.get('invoice_number', '')
         
-        for existing in self.invoices_db:
-            # Exact duplicate by invoice number
-            if existing.get('invoice_number') == invoice_num:
-                duplicates.append({
-                    'type': 'exact_duplicate',
-                    'severity': 'critical',
-                    'match': existing,
-                    'reason': f"Duplicate invoice number: {invoice_num}"
-                })
-            
-            # Same supplier + same amount within 30 days
-            if existing.get('supplier_name', '').lower() == supplier:
-                existing_amount = _safe_float(existing.get('total_amount'))
-                if abs(amount - existing_amount) < 0.01:
-                    # Check date proximity
-                    try:
-                        existing_date = datetime.fromisoformat(existing.get('timestamp', datetime.now().isoformat()))
-                        current_date = datetime.now()
-                        
-                        if abs((current_date - existing_date).days) <= 30:
-                            duplicates.append({
-                                'type': 'suspicious_duplicate',
-                                'severity': 'high',
-                                'match': existing,
-                                'reason': f"Same supplier + amount within 30 days"
-                            })
-                    except:
-                        pass
+        # Exact duplicate by invoice number
+        for existing in self.by_invoice_num.get(invoice_num, ()):
+            duplicates.append({
+                'type': 'exact_duplicate',
+                'severity': 'critical',
+                'match': existing,
+                'reason': f"Duplicate invoice number: {invoice_num}"
+            })
+        
+        # Same supplier + same amount within 30 days
+        # (neighbouring cent buckets too, so the < 0.01 tolerance is exact)
+        now = time.time()
+        cents = round(amount, 2)
+        for bucket in (round(cents - 0.01, 2), cents, round(cents + 0.01, 2)):
+            for epoch, existing_amount, existing in self.by_supplier_amount.get((supplier, bucket), ()):
+                if abs(amount - existing_amount) >= 0.01:
+                    continue
+                # |whole days| <= 30 with days floored; False for NaN epochs
+                if -30 * 86400 <= now - epoch < 31 * 86400:
+                    duplicates.append({
+                        'type': 'suspicious_duplicate',
+                        'severity': 'high',
+                        'match': existing,
+                        'reason': f"Same supplier + amount within 30 days"
+                    })
         
         return duplicates
     
-    def detect_round_number_fraud(self, invoice):
-        """Detect suspicious round numbers (potential fraud indicator)"""
+    def detect_round_number_fraud(self, invoice, tier=None):
+        """Detect suspicious round numbers (potential fraud indicator);
+        tier may be precomputed by _round_tiers for a whole batch"""
         amount = _safe_float(invoice.get('total_amount'))
+        if tier is None:
+            # Integer cents once, so the tiers are plain int modulo
+            # (same bounds as _round_tiers, without a one-element array)
+            cents = int(round(amount * 100))
+            if cents > 100000 and cents % 100000 == 0:
+                tier = ROUND_THOUSANDS
+            elif 10000 < cents < 100000 and cents % 10000 == 0:
+                tier = ROUND_HUNDREDS
+            else:
+                tier = ROUND_NONE
         
         # Check if it's a very round number
-        if amount > 1000 and amount % 1000 == 0:
+        if tier == ROUND_THOUSANDS:
             return {
                 'detected': True,
                 'severity': 'medium',
                 'reason': f"Suspiciously round amount: {amount} (possible fabricated invoice)"
             }
         
-        if amount > 100 and amount % 100 == 0 and amount < 1000:
+        if tier == ROUND_HUNDREDS:
             return {
                 'detected': True,
                 'severity': 'low',
@@ -109,18 +282,15 @@ class FraudDetectionAgent:
     
     def detect_velocity_attack(self, invoice):
         """Detect too many invoices from same supplier in short time"""
-        supplier = invoice.get('supplier_name', '').lower()
+        supplier = _supplier_key(invoice.get('supplier_name'))
         
         # Count invoices from this supplier in last 7 days
+        # (vectorised over the epochs parsed once at load; whole days floored)
+        now = time.time()
+        epochs = self.supplier_epochs.get(supplier)
         recent_count = 0
-        for existing in self.invoices_db:
-            if existing.get('supplier_name', '').lower() == supplier:
-                try:
-                    existing_date = datetime.fromisoformat(existing.get('timestamp', datetime.now().isoformat()))
-                    if (datetime.now() - existing_date).days <= 7:
-                        recent_count += 1
-                except:
-                    pass
+        if epochs is not None:
+            recent_count = int(np.count_nonzero(np.floor((now - epochs) / 86400.0) <= 7))
         
         if recent_count >= 5:
             return {
@@ -142,9 +312,11 @@ class FraudDetectionAgent:
             return {'detected': False}
         
         # Calculate expected total from line items
-        calculated_subtotal = sum([
-            _safe_float(item.get('total')) for item in line_items
-        ])
+        # (numeric totals skip the regex in _safe_float; summed as float64)
+        calculated_subtotal = float(np.fromiter(
+            (_safe_float(item.get('total')) for item in line_items),
+            dtype=np.float64, count=len(line_items)
+        ).sum())
         
         # Check if total matches
         expected_total = calculated_subtotal + vat
@@ -160,12 +332,17 @@ class FraudDetectionAgent:
         return {'detected': False}
     
     def calculate_risk_score(self, supplier_name):
-        """Calculate risk score for a supplier based on historical data"""
-        supplier = supplier_name.lower()
-        supplier_invoices = [
-            inv for inv in self.invoices_db 
-            if inv.get('supplier_name', '').lower() == supplier
-        ]
+        """Calculate risk score for a supplier based on historical data
+        (memoized per supplier until the database is reloaded)"""
+        supplier = _supplier_key(supplier_name)
+        if supplier not in self.risk_scores:
+            self.risk_scores[supplier] = self._compute_risk_score(supplier)
+        return dict(self.risk_scores[supplier])
+    
+    def _compute_risk_score(self, supplier):
+        """Risk statistics for one (lowercased) supplier from the indexes"""
+        supplier_entries = self.by_supplier.get(supplier, [])
+        supplier_invoices = [inv for _, _, inv in supplier_entries]
         
         if not supplier_invoices:
             return {
@@ -184,30 +361,22 @@ class FraudDetectionAgent:
             risk_factors += 1
         
         # Factor 2: Amount variance (high variance = risky)
-        amounts = [_safe_float(inv.get('total_amount')) for inv in supplier_invoices]
+        amounts = self.supplier_amounts[supplier]
         if len(amounts) > 1:
             total_factors += 1
-            avg = statistics.mean(amounts)
-            std = statistics.stdev(amounts)
+            avg = amounts.mean()
+            std = amounts.std(ddof=1)
             if std > avg * 0.5:  # High variance
                 risk_factors += 1
         
         # Factor 3: Invoice frequency (too frequent = suspicious)
         total_factors += 1
         if len(supplier_invoices) > 10:  # More than 10 invoices
-            dates = []
-            for inv in supplier_invoices:
-                try:
-                    dates.append(datetime.fromisoformat(inv.get('timestamp')))
-                except:
-                    pass
+            dates = self.supplier_epochs[supplier]
             
-            if dates:
-                dates.sort()
-                avg_days_between = sum([
-                    (dates[i+1] - dates[i]).days 
-                    for i in range(len(dates)-1)
-                ]) / (len(dates) - 1)
+            if len(dates) > 1:
+                # Whole days between consecutive invoices, floored like timedelta.days
+                avg_days_between = np.floor(np.diff(dates) / 86400.0).mean()
                 
                 if avg_days_between < 3:  # Less than 3 days average
                     risk_factors += 1
@@ -229,16 +398,16 @@ class FraudDetectionAgent:
             'flagged_invoices': flagged
         }
     
-    def analyze_with_ai(self, invoice, detected_issues):
-        """Use AI to provide additional fraud analysis"""
-        prompt = f"""
+    def _build_ai_prompt(self, invoice, detected_issues):
+        """Fraud-analysis prompt for one invoice"""
+        return f"""
         Analyze this invoice for potential fraud indicators.
         
         Invoice data:
-        {json.dumps(invoice, indent=2)}
+        {_compact_json(_strip_empty(invoice))}
         
         Already detected issues:
-        {json.dumps(detected_issues, indent=2)}
+        {_compact_json(detected_issues)}
         
         Provide:
         1. Additional fraud indicators not covered by rules
@@ -248,31 +417,200 @@ class FraudDetectionAgent:
         
         Return as JSON with keys: additional_indicators (array), fraud_probability, recommended_action, explanation
         """
+    
+    def _parse_ai_response(self, text):
+        """Strip markdown fences from a Gemini reply and parse it as JSON"""
+        result = text.strip()
+        
+        # Clean response
+        if result.startswith('```json'):
+            result = result[7:]
+        if result.startswith('```'):
+            result = result[3:]
+        if result.endswith('```'):
+            result = result[:-3]
+        result = result.strip()
+        
+        return json.loads(result)
+    
+    def _ai_failure(self, error):
+        """Neutral verdict used when the AI call or its parsing fails"""
+        return {
+            'additional_indicators': [],
+            'fraud_probability': 'unknown',
+            'recommended_action': 'review',
+            'explanation': f'AI analysis failed: {str(error)}'
+        }
+    
+    def _get_ai_cache(self):
+        """Open (and create if needed) the SQLite AI response cache"""
+        if self._ai_cache is None:
+            self._ai_cache = sqlite3.connect(AI_CACHE_FILE)
+            self._ai_cache.execute(
+                "CREATE TABLE IF NOT EXISTS ai_cache "
+                "(key TEXT PRIMARY KEY, response TEXT, ts INTEGER)"
+            )
+        return self._ai_cache
+    
+    def _ai_cache_get(self, key):
+        """Cached AI verdict for key, or None if absent/expired"""
+        row = self._get_ai_cache().execute(
+            "SELECT response FROM ai_cache WHERE key = ? AND ts >= ?",
+            (key, int(time.time()) - AI_CACHE_TTL_SECONDS)
+        ).fetchone()
+        if row is None:
+            self.ai_cache_misses += 1
+            return None
+        self.ai_cache_hits += 1
+        return orjson.loads(row[0])
+    
+    def _ai_cache_put(self, key, result):
+        """Store a successful AI verdict (failures are never cached)"""
+        cache = self._get_ai_cache()
+        cache.execute(
+            "INSERT OR REPLACE INTO ai_cache (key, response, ts) VALUES (?, ?, ?)",
+            (key, orjson.dumps(result).decode(), int(time.time()))
+        )
+        cache.commit()
+    
+    def analyze_with_ai(self, invoice, detected_issues):
+        """Use AI to provide additional fraud analysis"""
+        key = _ai_cache_key(invoice, detected_issues)
+        cached = self._ai_cache_get(key)
+        if cached is not None:
+            return cached
+        
+        prompt = self._build_ai_prompt(invoice, detected_issues)
         
         try:
-            response = model.generate_content(prompt)
-            result = response.text.strip()
-            
-            # Clean response
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-            result = result.strip()
-            
-            return json.loads(result)
+            response = self.model.generate_content(prompt)
+            result = self._parse_ai_response(response.text)
         except Exception as e:
-            return {
-                'additional_indicators': [],
-                'fraud_probability': 'unknown',
-                'recommended_action': 'review',
-                'explanation': f'AI analysis failed: {str(e)}'
-            }
+            return self._ai_failure(e)
+        
+        self._ai_cache_put(key, result)
+        return result
+    
+    def analyze_invoices_batch(self, items):
+        """
+        AI fraud analysis for many invoices at once.
+        items: list of (invoice, detected_issues); results come back in the
+        same order. Requests run concurrently (at most AI_CONCURRENCY in flight)
+        so a batch costs roughly one round trip instead of N.
+        """
+        async def _analyze_one(semaphore, invoice, detected_issues):
+            async with semaphore:
+                try:
+                    response = await self.model.generate_content_async(
+                        self._build_ai_prompt(invoice, detected_issues)
+                    )
+                    return self._parse_ai_response(response.text), True
+                except Exception as e:
+                    return self._ai_failure(e), False
+        
+        async def _analyze_all(pending):
+            semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+            return await asyncio.gather(*(
+                _analyze_one(semaphore, *items[i]) for i in pending
+            ))
+        
+        if not items:
+            return []
+        
+        # Serve repeats from the disk cache; only misses go to Gemini
+        keys = [_ai_cache_key(invoice, detected_issues) for invoice, detected_issues in items]
+        results = [self._ai_cache_get(key) for key in keys]
+        pending = [i for i, result in enumerate(results) if result is None]
+        
+        if pending:
+            for i, (result, ok) in zip(pending, asyncio.run(_analyze_all(pending))):
+                results[i] = result
+                if ok:
+                    self._ai_cache_put(keys[i], result)
+        return results
     
     def analyze_invoice(self, invoice_data):
         """Main fraud detection analysis"""
+        invoice, detected_issues, supplier_risk = self._run_rule_checks(invoice_data)
+        
+        # AI analysis
+        print("\n[6/6] AI-powered fraud analysis...")
+        ai_analysis = self.analyze_with_ai(invoice, detected_issues)
+        
+        return self._finish_report(invoice, detected_issues, supplier_risk, ai_analysis)
+    
+    def analyze_invoices(self, invoice_datas):
+        """
+        Fraud analysis for many invoices: amount rules run as NumPy column
+        ops over the batch, the remaining checks per invoice, then AI
+        verdicts for the invoices that need one are fetched in one
+        concurrent batch. Reports come back in input order.
+        
+        Each invoice is checked against the DB plus the invoices before it
+        in the batch, so verdicts match running analyze_invoice on them one
+        by one (saving each after its analysis).
+        """
+        invoices = [invoice_data.get('analysis', invoice_data) for invoice_data in invoice_datas]
+        tiers = _round_tiers([_safe_float(invoice.get('total_amount')) for invoice in invoices])
+        checked = []
+        try:
+            for invoice_data, tier in zip(invoice_datas, tiers):
+                checked.append(self._run_rule_checks(invoice_data, round_tier=tier))
+                self._add_batch_history(checked[-1][0])
+        finally:
+            # Batch invoices are only in memory; reread the DB next time
+            self._db_version = None
+        
+        # Clean invoices from low-risk suppliers are settled by the rules;
+        # only the flagged/uncertain tail goes to Gemini
+        needs_ai = [
+            i for i, (_, detected_issues, supplier_risk) in enumerate(checked)
+            if self._needs_ai(detected_issues, supplier_risk)
+        ]
+        print(f"\n[6/6] AI-powered fraud analysis ({len(needs_ai)} of {len(checked)} invoice(s) in parallel)...")
+        ai_analyses = [self._rules_verdict() for _ in checked]
+        batch = self.analyze_invoices_batch(
+            [(checked[i][0], checked[i][1]) for i in needs_ai]
+        )
+        for i, ai_analysis in zip(needs_ai, batch):
+            ai_analyses[i] = ai_analysis
+        
+        return [
+            self._finish_report(invoice, detected_issues, supplier_risk, ai_analysis)
+            for (invoice, detected_issues, supplier_risk), ai_analysis in zip(checked, ai_analyses)
+        ]
+    
+    def _add_batch_history(self, invoice):
+        """Index an analyzed batch invoice as history for the ones after it;
+        only its supplier's arrays and memoized risk score are refreshed"""
+        record = {
+            'invoice_number': invoice.get('invoice_number'),
+            'supplier_name': invoice.get('supplier_name'),
+            'total_amount': invoice.get('total_amount'),
+            'timestamp': datetime.now().isoformat(),
+            'flags': []
+        }
+        self.invoices_db.append(record)
+        self._index_invoice(record)
+        supplier = _supplier_key(record['supplier_name'])
+        self._finalize_supplier(supplier)
+        self.risk_scores.pop(supplier, None)
+    
+    def _needs_ai(self, detected_issues, supplier_risk):
+        """Clean invoices from low-risk suppliers are settled by the rules"""
+        return bool(detected_issues) or supplier_risk['level'] != 'low'
+    
+    def _rules_verdict(self):
+        """Verdict for an invoice the rules found nothing on"""
+        return {
+            'additional_indicators': [],
+            'fraud_probability': 'low',
+            'recommended_action': 'approve',
+            'explanation': 'No rule-based indicators and low supplier risk; AI review skipped'
+        }
+    
+    def _run_rule_checks(self, invoice_data, round_tier=None):
+        """Checks 1-5 plus supplier risk; returns (invoice, issues, risk)"""
         print(f"\n{'='*60}")
         print("Fraud Detection Analysis")
         print(f"{'='*60}")
@@ -301,7 +639,7 @@ class FraudDetectionAgent:
         
         # Check 2: Round numbers
         print("\n[3/6] Analyzing amount patterns...")
-        round_fraud = self.detect_round_number_fraud(invoice)
+        round_fraud = self.detect_round_number_fraud(invoice, tier=round_tier)
         if round_fraud['detected']:
             detected_issues.append(round_fraud)
             print(f"   WARN {round_fraud['severity'].upper()}: {round_fraud['reason']}")
@@ -331,10 +669,10 @@ class FraudDetectionAgent:
         print(f"\nSupplier Risk Score: {supplier_risk['score']}/100 ({supplier_risk['level']})")
         print(f"   Historical invoices: {supplier_risk.get('total_invoices', 0)}")
         
-        # AI analysis
-        print("\n[6/6] AI-powered fraud analysis...")
-        ai_analysis = self.analyze_with_ai(invoice, detected_issues)
-        
+        return invoice, detected_issues, supplier_risk
+    
+    def _finish_report(self, invoice, detected_issues, supplier_risk, ai_analysis):
+        """Print the verdict and append the full report to the log"""
         # Final verdict
         print(f"\n{'='*60}")
         print("Analysis Summary")
@@ -343,6 +681,7 @@ class FraudDetectionAgent:
         print(f"Fraud probability: {ai_analysis.get('fraud_probability', 'unknown').upper()}")
         print(f"Recommended action: {ai_analysis.get('recommended_action', 'review').upper()}")
         print(f"\nAI Insight: {ai_analysis.get('explanation', 'N/A')}")
+        print(f"AI cache: {self.ai_cache_hits} hit(s), {self.ai_cache_misses} miss(es)")
         
         # Save analysis report
         report = {
@@ -354,11 +693,9 @@ class FraudDetectionAgent:
             'total_issues': len(detected_issues)
         }
         
-        report_file = f"fraud_analysis_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        _append_report(report)
         
-        print(f"\nFull report saved to: {report_file}")
+        print(f"\nFull report appended to: {REPORT_LOG_FILE}")
         
         return report
 
@@ -368,20 +705,23 @@ if __name__ == "__main__":
     agent = FraudDetectionAgent()
     
     if len(sys.argv) < 2:
-        print("\nUsage: python agent_fraud_detection.py <result_file.json>")
-        print("   Example: python agent_fraud_detection.py result_20240210_220724.json")
-        print("\n   Analyzes an invoice result from the verification agent")
+        print("\nUsage: python agent_fraud_detection.py <result_file.json> [more_results.json ...]")
+        print("   Example: python agent_fraud_detection.py result_1707602844123456789.json")
+        print("\n   Analyzes invoice results from the verification agent")
+        print("   (the invoice database is parsed once and shared across files)")
         sys.exit(1)
     
-    result_file = sys.argv[1]
+    result_files = sys.argv[1:]
     
-    if not os.path.exists(result_file):
-        print(f"Error: File not found: {result_file}")
-        sys.exit(1)
+    for result_file in result_files:
+        if not os.path.exists(result_file):
+            print(f"Error: File not found: {result_file}")
+            sys.exit(1)
     
-    # Load invoice data
-    with open(result_file, 'r') as f:
-        invoice_data = json.load(f)
-    
-    # Run fraud analysis
-    agent.analyze_invoice(invoice_data)
\ No newline at end of file
+    for result_file in result_files:
+        # Load invoice data
+        with open(result_file, 'rb') as f:
+            invoice_data = orjson.loads(f.read())
+        
+        # Run fraud analysis
+        agent.analyze_invoice(invoice_data)
\ No newline at end of file
@@ -1,33 +1,86 @@
 import os
-import json
+import math
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
 from web3 import Web3
+import orjson
 import time
 
+import invoice_db
+
 load_dotenv()
 
 # Web3 setup
 w3 = Web3(Web3.HTTPProvider(os.getenv('BSC_TESTNET_RPC')))
 
+# How many recent blocks monitor_wallet scans
+MONITOR_BLOCKS = 10
+
+# Append-only report history, one compact JSON object per line
+REPORT_LOG_FILE = "reconciliations.ndjson"
+_report_log = None
+
+
+def _append_report(report):
+    """Append a report to the NDJSON log (file opened once per process)."""
+    global _report_log
+    if _report_log is None:
+        _report_log = open(REPORT_LOG_FILE, 'ab', buffering=0)
+    _report_log.write(orjson.dumps(
+        report, default=str, option=orjson.OPT_APPEND_NEWLINE
+    ))
+
+
+def _invoice_total(invoice):
+    """Invoice total as float; NaN (never matches) for placeholders like '$XXX'."""
+    try:
+        return float(invoice.get('total_amount', 0))
+    except (TypeError, ValueError):
+        return float('nan')
+
+
 class PaymentReconciliationAgent:
     def __init__(self, contract_address, mock_mode=True):
         self.contract_address = contract_address
         self.mock_mode = mock_mode
         self.pending_invoices = []
+        self._sorted_totals = []
+        self._sorted_index = []
         print("Payment Reconciliation Agent initialized")
         print(f"Mode: {'MOCK' if mock_mode else 'LIVE'}")
         
-    def load_pending_invoices(self, invoices_file="invoices_db.json"):
+    def load_pending_invoices(self, invoices_file=invoice_db.DB_FILE):
         """Load pending invoices from database"""
-        try:
-            with open(invoices_file, 'r') as f:
-                data = json.load(f)
-                self.pending_invoices = [inv for inv in data if inv.get('status') == 'pending']
-            print(f"Loaded {len(self.pending_invoices)} pending invoices")
-        except FileNotFoundError:
-            print("No invoices database found. Starting fresh.")
-            self.pending_invoices = []
+        # Read-only: reconciliation never creates, migrates or seeds the DB
+        conn = invoice_db.connect_readonly(invoices_file)
+        if conn is None:
+            # No DB yet: read the legacy JSON it would be seeded from
+            self.pending_invoices = [
+                record for record in invoice_db.read_legacy_json(invoices_file)
+                if record.get('status') == 'pending'
+            ]
+        else:
+            try:
+                # Uses the status index instead of scanning every invoice
+                self.pending_invoices = [
+                    invoice_db.row_to_dict(row) for row in conn.execute(
+                        "SELECT * FROM invoices WHERE status = 'pending' ORDER BY id"
+                    )
+                ]
+            finally:
+                conn.close()
+        print(f"Loaded {len(self.pending_invoices)} pending invoices")
+        
+        # Sorted (total, position) pairs for O(log N) exact-amount lookups
+        # (unparseable placeholder totals come back NaN and are skipped)
+        pairs = sorted(
+            (total, i) for i, total in enumerate(map(_invoice_total, self.pending_invoices))
+            if not math.isnan(total)
+        )
+        self._sorted_totals = [total for total, _ in pairs]
+        self._sorted_index = [i for _, i in pairs]
     
     def monitor_wallet(self, wallet_address, start_block='latest'):
         """Monitor wallet for incoming transactions"""
@@ -54,10 +107,10 @@ class PaymentReconciliationAgent:
             
             # Get recent transactions
             transactions = []
-            for i in range(10):  # Check last 10 blocks
-                block = w3.eth.get_block(latest_block - i, full_transactions=True)
+            wallet = wallet_address.lower()
+            for block in self._fetch_recent_blocks(latest_block):
                 for tx in block.transactions:
-                    if tx['to'] and tx['to'].lower() == wallet_address.lower():
+                    if tx['to'] and tx['to'].lower() == wallet:
                         transactions.append({
                             'tx_hash': tx['hash'].hex(),
                             'from': tx['from'],
@@ -74,33 +127,57 @@ class PaymentReconciliationAgent:
             print(f"Error monitoring blockchain: {e}")
             return []
     
+    def _fetch_recent_blocks(self, latest_block):
+        """Fetch the last MONITOR_BLOCKS blocks (newest first) in one batched
+        request, falling back to parallel single calls if batching fails."""
+        numbers = [latest_block - i for i in range(MONITOR_BLOCKS)]
+        try:
+            with w3.batch_requests() as batch:
+                for number in numbers:
+                    batch.add(w3.eth.get_block(number, full_transactions=True))
+                return batch.execute()
+        except Exception:
+            # Some RPC endpoints reject JSON-RPC batches
+            pass
+        
+        with ThreadPoolExecutor(max_workers=MONITOR_BLOCKS) as ex:
+            return list(ex.map(
+                lambda number: w3.eth.get_block(number, full_transactions=True),
+                numbers
+            ))
+    
     def match_payment_to_invoice(self, payment, tolerance=0.01):
         """Match a payment to a pending invoice"""
         payment_amount = float(payment['value'])
         
-        for invoice in self.pending_invoices:
-            invoice_total = float(invoice.get('total_amount', 0))
-            
-            # Match by amount (with small tolerance for rounding)
-            if abs(payment_amount - invoice_total) <= tolerance:
-                return {
-                    'matched': True,
-                    'invoice': invoice,
-                    'payment': payment,
-                    'match_type': 'exact',
-                    'difference': 0
-                }
-            
-            # Partial payment
-            elif payment_amount < invoice_total and payment_amount > 0:
-                return {
-                    'matched': True,
-                    'invoice': invoice,
-                    'payment': payment,
-                    'match_type': 'partial',
-                    'difference': invoice_total - payment_amount,
-                    'paid_percentage': (payment_amount / invoice_total) * 100
-                }
+        # Exact match (with small tolerance for rounding): bisect the sorted
+        # totals, earliest pending invoice wins among equal amounts
+        lo = bisect_left(self._sorted_totals, payment_amount - tolerance)
+        hi = bisect_right(self._sorted_totals, payment_amount + tolerance)
+        if lo < hi:
+            idx = min(self._sorted_index[lo:hi])
+            return {
+                'matched': True,
+                'invoice': self.pending_invoices[idx],
+                'payment': payment,
+                'match_type': 'exact',
+                'difference': 0
+            }
+        
+        # Partial payment: only when nothing matches exactly, pick the
+        # smallest pending total above the payment (earliest among equals)
+        pos = bisect_right(self._sorted_totals, payment_amount)
+        if payment_amount > 0 and pos < len(self._sorted_totals):
+            idx = self._sorted_index[pos]
+            invoice_total = self._sorted_totals[pos]
+            return {
+                'matched': True,
+                'invoice': self.pending_invoices[idx],
+                'payment': payment,
+                'match_type': 'partial',
+                'difference': invoice_total - payment_amount,
+                'paid_percentage': (payment_amount / invoice_total) * 100
+            }
         
         # No match found
         return {
@@ -168,9 +245,7 @@ class PaymentReconciliationAgent:
             'matches': matches
         }
         
-        report_file = f"reconciliation_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(report_file, 'w') as f:
-            json.dump(report, f, indent=2)
+        _append_report(report)
         
         print(f"\n{'='*60}")
         print("Reconciliation Complete")
@@ -179,7 +254,7 @@ class PaymentReconciliationAgent:
         print(f"   Total payments: {report['total_payments']}")
         print(f"   Matched: {report['matched_payments']}")
         print(f"   Unmatched: {report['unmatched_payments']}")
-        print(f"\nFull report saved to: {report_file}")
+        print(f"\nFull report appended to: {REPORT_LOG_FILE}")
         
         return matches
 
@@ -1,23 +1,145 @@
 import os
 import json
+import asyncio
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
-from web3 import Web3
+from eth_abi import encode as abi_encode
+from eth_utils import function_signature_to_4byte_selector
+from web3 import AsyncHTTPProvider, AsyncWeb3, Web3
+from web3.exceptions import TimeExhausted, TransactionNotFound
 import google.generativeai as genai
 
 load_dotenv()
 
 # Web3 setup
-w3 = Web3(Web3.HTTPProvider(os.getenv('BSC_TESTNET_RPC', 'https://data-seed-prebsc-1-s1.binance.org:8545/')))
+BSC_RPC_URL = os.getenv('BSC_TESTNET_RPC', 'https://data-seed-prebsc-1-s1.binance.org:8545/')
+w3 = Web3(Web3.HTTPProvider(BSC_RPC_URL))
+
+# Async client for tokenize_invoice_async, created on first use
+_async_w3 = None
+RECEIPT_POLL_SECONDS = 2
+
+# Parallel send_raw_transaction calls in tokenize_many
+BROADCAST_WORKERS = 8
+
+
+def _get_async_w3():
+    """Shared AsyncWeb3 client on the same RPC endpoint"""
+    global _async_w3
+    if _async_w3 is None:
+        _async_w3 = AsyncWeb3(AsyncHTTPProvider(BSC_RPC_URL))
+    return _async_w3
 
 # Configure AI
 genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
 model = genai.GenerativeModel(os.getenv("GEMINI_MODEL", "gemini-2.0-flash"))
 
+# Static instructions; each request is instruction + invoice fields
+PRICING_INSTRUCTION = """Price early payment of this invoice for a financing marketplace.
+Apply a time discount to the due date, a premium for fraud risk, and the
+typical 1-5% per month financing rate. Give brief reasoning."""
+
+MARKETPLACE_INSTRUCTION = """Should this invoice be tokenized for an early payment marketplace?
+Weigh amount (min $500 recommended), fraud risk (max 30/100 recommended)
+and buyer interest."""
+
+# Answers are small fixed-shape JSON: have Gemini emit it directly against a
+# schema, deterministically, and stop early
+AI_MAX_OUTPUT_TOKENS = 128
+
+PRICING_CONFIG = genai.GenerationConfig(
+    max_output_tokens=AI_MAX_OUTPUT_TOKENS,
+    temperature=0.0,
+    response_mime_type="application/json",
+    response_schema={
+        "type": "object",
+        "properties": {
+            "recommended_price": {"type": "number"},
+            "discount_percentage": {"type": "number"},
+            "confidence": {"type": "integer"},
+            "reasoning": {"type": "string"}
+        },
+        "required": ["recommended_price", "discount_percentage", "confidence", "reasoning"]
+    }
+)
+
+MARKETPLACE_CONFIG = genai.GenerationConfig(
+    max_output_tokens=AI_MAX_OUTPUT_TOKENS,
+    temperature=0.0,
+    response_mime_type="application/json",
+    response_schema={
+        "type": "object",
+        "properties": {
+            "should_tokenize": {"type": "boolean"},
+            "confidence": {"type": "integer"},
+            "reasons": {"type": "array", "items": {"type": "string"}},
+            "estimated_time_to_sell": {"type": "string"}
+        },
+        "required": ["should_tokenize", "confidence", "reasons", "estimated_time_to_sell"]
+    }
+)
+
+GENERATION_CONFIGS = {
+    PRICING_INSTRUCTION: PRICING_CONFIG,
+    MARKETPLACE_INSTRUCTION: MARKETPLACE_CONFIG
+}
+
+# Marketplace decisions outside these gray zones are settled by rules alone;
+# only invoices inside them are sent to Gemini
+GRAY_AMOUNT_MIN = float(os.getenv('MARKETPLACE_GRAY_AMOUNT_MIN', '400'))
+GRAY_AMOUNT_MAX = float(os.getenv('MARKETPLACE_GRAY_AMOUNT_MAX', '800'))
+GRAY_FRAUD_MIN = float(os.getenv('MARKETPLACE_GRAY_FRAUD_MIN', '25'))
+GRAY_FRAUD_MAX = float(os.getenv('MARKETPLACE_GRAY_FRAUD_MAX', '40'))
+
+# Pricing only goes to Gemini inside this band; extremes (near-certain
+# reject / flat rate) and tiny invoices use the rule-based price
+PRICING_AI_FRAUD_MIN = float(os.getenv('PRICING_AI_FRAUD_MIN', '5'))
+PRICING_AI_FRAUD_MAX = float(os.getenv('PRICING_AI_FRAUD_MAX', '50'))
+PRICING_AI_MIN_AMOUNT = float(os.getenv('PRICING_AI_MIN_AMOUNT', '100'))
+
+# Max concurrent Gemini pricing requests in tokenize_many
+AI_CONCURRENCY = 8
+
+# Local cache of pricing/marketplace answers, keyed on the exact prompt
+# (shares the fraud agent's SQLite file, separate table)
+AI_CACHE_FILE = "ai_cache.db"
+AI_CACHE_TTL_SECONDS = 24 * 3600
+
+
+def _prompt_cache_key(prompt):
+    """Stable BLAKE2b digest of the model name + prompt text."""
+    payload = f"{model.model_name}\n{prompt}".encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+# Everything but digits, sign and decimal point ($, commas, spaces, codes)
+_AMOUNT_RE = re.compile(r'[^\d.\-]')
+
+
+def _parse_amount(value, default=0.0):
+    """'$1,500.00' / 1500 -> 1500.0 in one regex pass; default if unparseable."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    cleaned = _AMOUNT_RE.sub('', str(value))
+    if not cleaned:
+        return default
+    try:
+        return float(cleaned)
+    except ValueError:
+        return default
+
+
 # Smart contract (will be deployed)
 NFT_CONTRACT_ADDRESS = os.getenv('NFT_CONTRACT_ADDRESS', '0x0000000000000000000000000000000000000000')
 
-NFT_CONTRACT_ABI = [
+# Tuple: shared, never mutated
+NFT_CONTRACT_ABI = (
     {
         "inputs": [
             {"name": "_documentHash", "type": "bytes32"},
@@ -64,79 +186,161 @@ NFT_CONTRACT_ABI = [
         "stateMutability": "view",
         "type": "function"
     }
-]
+)
+
+# mintInvoice calldata is selector + ABI-encoded args; both fixed up front
+# so live mints skip the contract/ABI lookup on every transaction
+MINT_ARG_TYPES = ("bytes32", "uint256", "uint256", "uint8", "string")
+MINT_SELECTOR = function_signature_to_4byte_selector(
+    f"mintInvoice({','.join(MINT_ARG_TYPES)})"
+)
 
 class InvoiceTokenizationAgent:
     def __init__(self, mock_mode=True):
         self.mock_mode = mock_mode
+        self._ai_cache = None
+        # Prompt key -> in-flight Gemini request, shared by identical prompts
+        # within one batch (entries drop out as soon as they complete)
+        self._inflight = {}
+        self._account = None
+        self._contract_address = None
+        self._chain_id = None
+        self._nonce = None
+        self._nonce_lock = threading.Lock()
         print("Invoice Tokenization Agent initialized")
         print(f"Mode: {'MOCK' if mock_mode else 'LIVE (NFT minting active)'}")
         
         if not mock_mode and w3.is_connected():
             print(f"✓ Connected to BSC Testnet")
             
-    def calculate_ai_pricing(self, invoice_data, fraud_score):
-        """
-        Use AI to calculate optimal pricing for invoice sale
-        Considers: amount, due date, fraud risk, market conditions
-        """
+    def _init_chain_state(self):
+        """Derive account and contract once per agent"""
+        private_key = os.getenv('WALLET_PRIVATE_KEY')
+        if not private_key:
+            return False
         
-        # Extract key data
-        total_amount = invoice_data.get('total_amount', '0')
+        self._account = w3.eth.account.from_key(private_key)
+        self._contract_address = Web3.to_checksum_address(NFT_CONTRACT_ADDRESS)
+        return True
+    
+    def _prefetch_tx_params(self, account):
+        """Nonce, gas price and chain id in one batched JSON-RPC round trip
+        (chain id only until first known); sequential if batching fails"""
+        need_chain_id = self._chain_id is None
+        try:
+            with w3.batch_requests() as batch:
+                batch.add(w3.eth.get_transaction_count(account.address))
+                batch.add(w3.eth.gas_price)
+                if need_chain_id:
+                    batch.add(w3.eth.chain_id)
+                responses = batch.execute()
+            
+            if need_chain_id:
+                self._chain_id = responses[2]
+            return responses[0], responses[1]
+        except Exception:
+            # Some RPC endpoints reject JSON-RPC batches
+            pass
         
-        # Handle both string and numeric types
-        if isinstance(total_amount, (int, float)):
-            amount = float(total_amount)
-        else:
-            # String type - clean it
-            amount_str = str(total_amount).replace('$', '').replace(',', '').strip()
-            try:
-                amount = float(amount_str)
-            except:
-                amount = 0
+        if need_chain_id:
+            self._chain_id = w3.eth.chain_id
+        return w3.eth.get_transaction_count(account.address), w3.eth.gas_price
+    
+    def _next_tx_params(self, account):
+        """(chain nonce, gas price) for the next mint; the chain's nonce is
+        read only while the local pool is unseeded (0 = defer to the pool)"""
+        with self._nonce_lock:
+            seeded = self._nonce is not None
+        if seeded:
+            return 0, w3.eth.gas_price
+        return self._prefetch_tx_params(account)
+    
+    def _reset_nonce(self):
+        """Drop the local nonce pool after a failed send; the next mint
+        resyncs with the chain"""
+        with self._nonce_lock:
+            self._nonce = None
+    
+    def _get_ai_cache(self):
+        """Open (and create if needed) the SQLite AI response cache"""
+        if self._ai_cache is None:
+            self._ai_cache = sqlite3.connect(AI_CACHE_FILE)
+            self._ai_cache.execute(
+                "CREATE TABLE IF NOT EXISTS tokenization_cache "
+                "(key TEXT PRIMARY KEY, response TEXT, ts INTEGER)"
+            )
+        return self._ai_cache
+    
+    def _ai_cache_get(self, key):
+        """Cached answer for key, or None if absent/expired"""
+        row = self._get_ai_cache().execute(
+            "SELECT response FROM tokenization_cache WHERE key = ? AND ts >= ?",
+            (key, int(time.time()) - AI_CACHE_TTL_SECONDS)
+        ).fetchone()
+        return None if row is None else json.loads(row[0])
+    
+    def _ai_cache_put(self, key, result):
+        """Store a successfully parsed answer"""
+        cache = self._get_ai_cache()
+        cache.execute(
+            "INSERT OR REPLACE INTO tokenization_cache (key, response, ts) VALUES (?, ?, ?)",
+            (key, json.dumps(result), int(time.time()))
+        )
+        cache.commit()
+    
+    def _generate_json(self, instruction, details):
+        """Schema-constrained JSON answer for instruction + invoice details,
+        served from the disk cache when a fresh entry exists; only
+        successful parses are cached"""
+        prompt = f"{instruction}\n\n{details}"
+        key = _prompt_cache_key(prompt)
+        result = self._ai_cache_get(key)
+        if result is not None:
+            return result
         
-        due_date = invoice_data.get('date', 'unknown')
-        supplier = invoice_data.get('supplier_name', 'unknown')
+        response = model.generate_content(prompt, generation_config=GENERATION_CONFIGS[instruction])
+        result = json.loads(response.text)
+        self._ai_cache_put(key, result)
+        return result
+    
+    async def _generate_json_async(self, instruction, details):
+        """Awaitable _generate_json for concurrent callers; identical
+        prompts already in flight await that request instead of sending
+        their own"""
+        prompt = f"{instruction}\n\n{details}"
+        key = _prompt_cache_key(prompt)
+        result = self._ai_cache_get(key)
+        if result is not None:
+            return result
         
-        prompt = f"""
-        You are an AI pricing agent for an invoice financing marketplace.
-        
-        Invoice Details:
-        - Amount: ${amount}
-        - Due Date: {due_date}
-        - Supplier: {supplier}
-        - Fraud Risk Score: {fraud_score}/100 (0=safe, 100=high risk)
-        
-        Calculate optimal pricing for early payment:
-        1. Time discount: How much discount for paying before due date?
-        2. Risk premium: Additional discount for fraud risk?
-        3. Market rate: Typical invoice financing is 1-5% discount per month
-        
-        Return JSON with:
-        {{
-            "recommended_price": <dollar amount>,
-            "discount_percentage": <percentage>,
-            "confidence": <0-100>,
-            "reasoning": "<brief explanation>"
-        }}
-        
-        Return ONLY valid JSON, no additional text.
+        request = self._inflight.get(key)
+        if request is None:
+            request = asyncio.ensure_future(self._request_json_async(instruction, prompt, key))
+            self._inflight[key] = request
+            request.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Copy so callers sharing one answer cannot mutate each other's
+        return dict(await request)
+    
+    async def _request_json_async(self, instruction, prompt, key):
+        """One Gemini request for a prompt, cached on success"""
+        response = await model.generate_content_async(
+            prompt, generation_config=GENERATION_CONFIGS[instruction]
+        )
+        result = json.loads(response.text)
+        self._ai_cache_put(key, result)
+        return result
+    
+    def calculate_ai_pricing(self, invoice_data, fraud_score):
         """
+        Use AI to calculate optimal pricing for invoice sale
+        Considers: amount, due date, fraud risk, market conditions
+        """
+        amount, details = self._pricing_details(invoice_data, fraud_score)
+        if not self._pricing_needs_ai(amount, fraud_score):
+            return self._fallback_pricing(amount, fraud_score)
         
         try:
-            response = model.generate_content(prompt)
-            result = response.text.strip()
-            
-            # Clean response
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-            result = result.strip()
-            
-            pricing = json.loads(result)
+            pricing = self._generate_json(PRICING_INSTRUCTION, details)
             return pricing
             
         except Exception as e:
@@ -144,6 +348,40 @@ class InvoiceTokenizationAgent:
             print(f"⚠️  AI pricing failed: {e}")
             return self._fallback_pricing(amount, fraud_score)
     
+    async def calculate_ai_pricing_async(self, invoice_data, fraud_score):
+        """Awaitable calculate_ai_pricing (same fallback on failure)"""
+        amount, details = self._pricing_details(invoice_data, fraud_score)
+        if not self._pricing_needs_ai(amount, fraud_score):
+            return self._fallback_pricing(amount, fraud_score)
+        
+        try:
+            return await self._generate_json_async(PRICING_INSTRUCTION, details)
+        except Exception as e:
+            print(f"⚠️  AI pricing failed: {e}")
+            return self._fallback_pricing(amount, fraud_score)
+    
+    def _pricing_details(self, invoice_data, fraud_score):
+        """Parsed amount and the per-invoice part of the pricing prompt"""
+        # Extract key data
+        amount = _parse_amount(invoice_data.get('total_amount', '0'))
+        
+        due_date = invoice_data.get('date', 'unknown')
+        supplier = invoice_data.get('supplier_name', 'unknown')
+        
+        details = f"""Invoice Details:
+- Amount: ${amount}
+- Due Date: {due_date}
+- Supplier: {supplier}
+- Fraud Risk Score: {fraud_score}/100 (0=safe, 100=high risk)"""
+        return amount, details
+    
+    def _pricing_needs_ai(self, amount, fraud_score):
+        """True when the invoice is inside the band where AI pricing pays off"""
+        return (
+            amount >= PRICING_AI_MIN_AMOUNT
+            and PRICING_AI_FRAUD_MIN < fraud_score < PRICING_AI_FRAUD_MAX
+        )
+    
     def _fallback_pricing(self, amount, fraud_score):
         """Simple rule-based pricing when AI fails"""
         # Base discount: 2%
@@ -166,36 +404,185 @@ class InvoiceTokenizationAgent:
         """
         Mint invoice as NFT on blockchain
         """
+        amount_dollars = self._start_tokenization(invoice_data)
+        if amount_dollars is None:
+            return None
+        
+        # Get AI pricing
+        print("\n[1/3] Calculating optimal pricing with AI...")
+        pricing = self.calculate_ai_pricing(invoice_data, fraud_score)
+        
+        try:
+            mock_result, signed_txn = self._prepare_mint(
+                invoice_hash, invoice_data, fraud_score, amount_dollars, pricing
+            )
+            if signed_txn is None:
+                return mock_result
+            
+            tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+            
+            print(f"✓ Transaction sent: {tx_hash.hex()}")
+            print(f"  Waiting for confirmation...")
+            
+            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            return self._mint_result(receipt, tx_hash, amount_dollars, pricing)
+                
+        except Exception as e:
+            self._reset_nonce()
+            print(f"❌ Blockchain error: {e}")
+            return None
+    
+    async def tokenize_invoice_async(self, invoice_hash, invoice_data, fraud_score, timeout=120):
+        """
+        Awaitable tokenize_invoice: pricing, broadcast and confirmation are
+        awaited, so other invoices make progress while this one is mined
+        """
+        amount_dollars = self._start_tokenization(invoice_data)
+        if amount_dollars is None:
+            return None
+        
+        print("\n[1/3] Calculating optimal pricing with AI...")
+        pricing = await self.calculate_ai_pricing_async(invoice_data, fraud_score)
+        
+        try:
+            mock_result, signed_txn = self._prepare_mint(
+                invoice_hash, invoice_data, fraud_score, amount_dollars, pricing
+            )
+            if signed_txn is None:
+                return mock_result
+            
+            async_w3 = _get_async_w3()
+            tx_hash = await async_w3.eth.send_raw_transaction(signed_txn.raw_transaction)
+            
+            print(f"✓ Transaction sent: {tx_hash.hex()}")
+            print(f"  Waiting for confirmation...")
+            
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    receipt = await async_w3.eth.get_transaction_receipt(tx_hash)
+                    break
+                except TransactionNotFound:
+                    if time.monotonic() >= deadline:
+                        raise TimeExhausted(f"Transaction {tx_hash.hex()} not mined after {timeout}s")
+                    await asyncio.sleep(RECEIPT_POLL_SECONDS)
+            
+            return self._mint_result(receipt, tx_hash, amount_dollars, pricing)
+        
+        except Exception as e:
+            self._reset_nonce()
+            print(f"❌ Blockchain error: {e}")
+            return None
+    
+    def tokenize_many(self, items):
+        """
+        Mint several invoices without waiting between them: pricing runs
+        concurrently, every mint is signed nonce-ahead, broadcast in
+        parallel, then confirmed in one pass.
+        items: list of (invoice_hash, invoice_data, fraud_score); results
+        come back in the same order (None = invalid/failed)
+        """
+        if self.mock_mode:
+            return [self.tokenize_invoice(*item) for item in items]
+        
+        async def _price_all():
+            semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+            async def _price_one(invoice_data, fraud_score):
+                async with semaphore:
+                    return await self.calculate_ai_pricing_async(invoice_data, fraud_score)
+            return await asyncio.gather(*(
+                _price_one(invoice_data, fraud_score) for _, invoice_data, fraud_score in items
+            ))
+        
+        results = [None] * len(items)
+        if not items:
+            return results
+        
+        print(f"\n[1/3] Calculating optimal pricing with AI for {len(items)} invoice(s)...")
+        pricings = asyncio.run(_price_all())
+        
+        if self._account is None and not self._init_chain_state():
+            print("❌ WALLET_PRIVATE_KEY not set")
+            return results
+        try:
+            # One gas price read for the batch (plus the nonce if the
+            # pool is not seeded yet)
+            chain_nonce, gas_price = self._next_tx_params(self._account)
+        except Exception as e:
+            print(f"❌ Blockchain error: {e}")
+            return results
+        
+        # Sign everything up front (CPU only); nonces come from the local
+        # pool, which only advances past successfully signed mints
+        pending = []
+        with self._nonce_lock:
+            nonce = max(chain_nonce, self._nonce or 0)
+            for i, ((invoice_hash, invoice_data, fraud_score), pricing) in enumerate(zip(items, pricings)):
+                amount_dollars = self._start_tokenization(invoice_data)
+                if amount_dollars is None:
+                    continue
+                try:
+                    _, signed_txn = self._prepare_mint(
+                        invoice_hash, invoice_data, fraud_score, amount_dollars, pricing,
+                        nonce=nonce, gas_price=gas_price
+                    )
+                except Exception as e:
+                    print(f"❌ Blockchain error: {e}")
+                    continue
+                nonce += 1
+                pending.append((i, signed_txn, amount_dollars, pricing))
+            self._nonce = nonce
+        
+        print(f"\n📤 Broadcasting {len(pending)} mint transaction(s)...")
+        with ThreadPoolExecutor(max_workers=BROADCAST_WORKERS) as ex:
+            futures = [
+                (i, ex.submit(w3.eth.send_raw_transaction, signed_txn.raw_transaction), amount_dollars, pricing)
+                for i, signed_txn, amount_dollars, pricing in pending
+            ]
+        
+        for i, future, amount_dollars, pricing in futures:
+            try:
+                tx_hash = future.result()
+                receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+                results[i] = self._mint_result(receipt, tx_hash, amount_dollars, pricing)
+            except Exception as e:
+                # A gap in the nonce sequence; resync before the next mint
+                self._reset_nonce()
+                print(f"❌ Blockchain error: {e}")
+        
+        return results
+    
+    def _start_tokenization(self, invoice_data):
+        """Print the banner and parse the face value (None if invalid)"""
         print("\n" + "="*60)
         print("TOKENIZING INVOICE AS NFT")
         print("="*60)
         
         # Parse invoice amount (convert to smallest unit - cents)
-        total_amount = invoice_data.get('total_amount', '0')
-        
-        # Handle both string and numeric types
-        if isinstance(total_amount, (int, float)):
-            amount_dollars = float(total_amount)
-        else:
-            # String type - clean it
-            amount_str = str(total_amount).replace('$', '').replace(',', '').strip()
-            try:
-                amount_dollars = float(amount_str)
-            except:
-                print("❌ Invalid amount format")
-                return None
+        amount_dollars = _parse_amount(invoice_data.get('total_amount', '0'), default=None)
+        if amount_dollars is None:
+            print("❌ Invalid amount format")
+        return amount_dollars
+    
+    def _prepare_mint(self, invoice_hash, invoice_data, fraud_score, amount_dollars, pricing,
+                      nonce=None, gas_price=None):
+        """
+        Everything before broadcast. Returns (mock_result, None) in mock mode
+        or when no wallet is configured, else (None, signed mint transaction)
+        Batch callers pass nonce/gas_price from one prefetch and advance the
+        nonce pool themselves; otherwise the gas price (and, while the pool
+        is unseeded, the chain nonce) is fetched here and the pool moves
+        only once the transaction is signed
+        """
+        print(f"✓ Recommended price: ${pricing['recommended_price']}")
+        print(f"  Discount: {pricing['discount_percentage']}%")
+        print(f"  Reasoning: {pricing['reasoning']}")
         
         amount_cents = int(amount_dollars * 100)
         
         # Calculate due date (assume 30 days if not specified)
-        due_date_timestamp = int((datetime.now() + timedelta(days=30)).timestamp())
-        
-        # Get AI pricing
-        print("\n[1/3] Calculating optimal pricing with AI...")
-        pricing = self.calculate_ai_pricing(invoice_data, fraud_score)
-        print(f"✓ Recommended price: ${pricing['recommended_price']}")
-        print(f"  Discount: {pricing['discount_percentage']}%")
-        print(f"  Reasoning: {pricing['reasoning']}")
+        now = datetime.now()
+        due_date_timestamp = int((now + timedelta(days=30)).timestamp())
         
         # Prepare metadata
         metadata = {
@@ -204,12 +591,15 @@ class InvoiceTokenizationAgent:
             "original_amount": amount_dollars,
             "recommended_price": pricing['recommended_price'],
             "fraud_score": fraud_score,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now.isoformat()
         }
         
         if self.mock_mode:
             # Mock tokenization
-            mock_token_id = hash(invoice_hash) % 100000
+            # Deterministic across runs, unlike the salted built-in hash()
+            mock_token_id = int.from_bytes(
+                hashlib.blake2b(invoice_hash.encode(), digest_size=8).digest(), 'big'
+            ) % 100000
             print(f"\n[2/3] MOCK: Minting NFT...")
             print(f"✓ Token ID: #{mock_token_id}")
             print(f"✓ Contract: {NFT_CONTRACT_ADDRESS} (MOCK)")
@@ -227,129 +617,132 @@ class InvoiceTokenizationAgent:
                 "listed_price": pricing['recommended_price'],
                 "discount": pricing['discount_percentage'],
                 "mode": "MOCK"
-            }
+            }, None
         
-        try:
-            # Real blockchain minting
-            private_key = os.getenv('WALLET_PRIVATE_KEY')
-            if not private_key:
-                print("❌ WALLET_PRIVATE_KEY not set")
-                return None
-            
-            account = w3.eth.account.from_key(private_key)
-            contract = w3.eth.contract(
-                address=Web3.to_checksum_address(NFT_CONTRACT_ADDRESS),
-                abi=NFT_CONTRACT_ABI
-            )
-            
-            # Convert hash to bytes32
-            hash_bytes = bytes.fromhex(invoice_hash.replace('0x', '')[:64])
-            
-            print(f"\n[2/3] Minting NFT on blockchain...")
-            
-            # Build transaction
-            txn = contract.functions.mintInvoice(
-                hash_bytes,
-                amount_cents,
-                due_date_timestamp,
-                fraud_score,
-                json.dumps(metadata)
-            ).build_transaction({
+        # Real blockchain minting
+        if self._account is None and not self._init_chain_state():
+            print("❌ WALLET_PRIVATE_KEY not set")
+            return None, None
+        
+        account = self._account
+        
+        # Convert hash to bytes32
+        hash_bytes = bytes.fromhex(invoice_hash.replace('0x', '')[:64])
+        
+        print(f"\n[2/3] Minting NFT on blockchain...")
+        
+        # Calldata encoded directly, gas is fixed
+        data = MINT_SELECTOR + abi_encode(
+            MINT_ARG_TYPES,
+            (hash_bytes, amount_cents, due_date_timestamp, fraud_score, json.dumps(metadata))
+        )
+        
+        def sign(nonce, gas_price):
+            return account.sign_transaction({
                 'from': account.address,
-                'nonce': w3.eth.get_transaction_count(account.address),
+                'to': self._contract_address,
+                'data': data,
+                'value': 0,
+                'nonce': nonce,
                 'gas': 500000,
-                'gasPrice': w3.eth.gas_price
+                'gasPrice': gas_price,
+                'chainId': self._chain_id
             })
+        
+        if nonce is not None:
+            return None, sign(nonce, gas_price)
+        
+        chain_nonce, gas_price = self._next_tx_params(account)
+        # Track the next nonce locally so mints prepared before earlier
+        # ones are mined (async/batch) never reuse a nonce; a failed
+        # signature leaves the pool where it was
+        with self._nonce_lock:
+            nonce = max(chain_nonce, self._nonce or 0)
+            signed_txn = sign(nonce, gas_price)
+            self._nonce = nonce + 1
+        return None, signed_txn
+    
+    def _mint_result(self, receipt, tx_hash, amount_dollars, pricing):
+        """Tokenization result from a mined receipt (None if it reverted)"""
+        if receipt['status'] == 1:
+            print(f"✅ NFT minted successfully!")
+            # Extract token ID from logs
+            token_id = receipt['logs'][0]['topics'][1].hex() if receipt['logs'] else "unknown"
             
-            # Sign and send
-            signed_txn = w3.eth.account.sign_transaction(txn, private_key)
-            tx_hash = w3.eth.send_raw_transaction(signed_txn.raw_transaction)
-            
-            print(f"✓ Transaction sent: {tx_hash.hex()}")
-            print(f"  Waiting for confirmation...")
-            
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash, timeout=120)
+            print(f"\n[3/3] Invoice tokenized!")
+            print(f"✓ Token ID: #{token_id}")
+            print(f"✓ View on BSCScan: https://testnet.bscscan.com/tx/{tx_hash.hex()}")
             
-            if receipt['status'] == 1:
-                print(f"✅ NFT minted successfully!")
-                # Extract token ID from logs
-                token_id = receipt['logs'][0]['topics'][1].hex() if receipt['logs'] else "unknown"
-                
-                print(f"\n[3/3] Invoice tokenized!")
-                print(f"✓ Token ID: #{token_id}")
-                print(f"✓ View on BSCScan: https://testnet.bscscan.com/tx/{tx_hash.hex()}")
-                
-                return {
-                    "success": True,
-                    "token_id": token_id,
-                    "tx_hash": tx_hash.hex(),
-                    "face_value": amount_dollars,
-                    "recommended_price": pricing['recommended_price'],
-                    "discount": pricing['discount_percentage'],
-                    "mode": "LIVE"
-                }
-            else:
-                print("❌ Transaction failed")
-                return None
-                
-        except Exception as e:
-            print(f"❌ Blockchain error: {e}")
+            return {
+                "success": True,
+                "token_id": token_id,
+                "tx_hash": tx_hash.hex(),
+                "face_value": amount_dollars,
+                "recommended_price": pricing['recommended_price'],
+                "discount": pricing['discount_percentage'],
+                "mode": "LIVE"
+            }
+        else:
+            print("❌ Transaction failed")
             return None
     
     def analyze_marketplace_opportunity(self, invoice_data, fraud_score):
         """
         Analyze if invoice is good candidate for tokenization
         """
-        total_amount = invoice_data.get('total_amount', '0')
+        amount, details = self._marketplace_details(invoice_data, fraud_score)
+        decision = self._rule_marketplace(amount, fraud_score)
+        if decision is not None:
+            return decision
         
-        # Handle both string and numeric types
-        if isinstance(total_amount, (int, float)):
-            amount = float(total_amount)
-        else:
-            # String type - clean it
-            amount_str = str(total_amount).replace('$', '').replace(',', '').strip()
-            try:
-                amount = float(amount_str)
-            except:
-                amount = 0
-        
-        prompt = f"""
-        Should this invoice be tokenized for early payment marketplace?
-        
-        Invoice:
-        - Amount: ${amount}
-        - Supplier: {invoice_data.get('supplier_name')}
-        - Fraud Score: {fraud_score}/100
-        
-        Consider:
-        - Is amount large enough? (min $500 recommended)
-        - Is fraud risk acceptable? (max 30/100 recommended)
-        - Would buyers be interested?
-        
-        Return JSON:
-        {{
-            "should_tokenize": <true/false>,
-            "confidence": <0-100>,
-            "reasons": ["reason1", "reason2"],
-            "estimated_time_to_sell": "<hours/days>"
-        }}
-        """
+        try:
+            return self._generate_json(MARKETPLACE_INSTRUCTION, details)
+        except Exception:
+            return self._fallback_marketplace(amount, fraud_score)
+    
+    async def analyze_marketplace_opportunity_async(self, invoice_data, fraud_score):
+        """Awaitable analyze_marketplace_opportunity (same fallback on failure)"""
+        amount, details = self._marketplace_details(invoice_data, fraud_score)
+        decision = self._rule_marketplace(amount, fraud_score)
+        if decision is not None:
+            return decision
         
         try:
-            response = model.generate_content(prompt)
-            result = response.text.strip()
-            
-            if result.startswith('```json'):
-                result = result[7:]
-            if result.startswith('```'):
-                result = result[3:]
-            if result.endswith('```'):
-                result = result[:-3]
-            
-            return json.loads(result.strip())
-        except:
-            # Fallback
-            return {
+            return await self._generate_json_async(MARKETPLACE_INSTRUCTION, details)
+        except Exception:
+            return self._fallback_marketplace(amount, fraud_score)
+    
+    def _marketplace_details(self, invoice_data, fraud_score):
+        """Parsed amount and the per-invoice part of the marketplace prompt"""
+        amount = _parse_amount(invoice_data.get('total_amount', '0'))
+        
+        details = f"""Invoice:
+- Amount: ${amount}
+- Supplier: {invoice_data.get('supplier_name')}
+- Fraud Score: {fraud_score}/100"""
+        return amount, details
+    
+    def _rule_marketplace(self, amount, fraud_score):
+        """Rule-based decision for clear-cut invoices, None for gray-zone ones.
+        Too risky or too small rejects outright; only an invoice that is
+        both clearly large enough and clearly safe is accepted without AI."""
+        if fraud_score >= GRAY_FRAUD_MAX or amount < GRAY_AMOUNT_MIN:
+            should_tokenize = False
+        elif amount >= GRAY_AMOUNT_MAX and fraud_score <= GRAY_FRAUD_MIN:
+            should_tokenize = True
+        else:
+            return None
+        
+        return {
+            "should_tokenize": should_tokenize,
+            "confidence": 95,
+            "reasons": [f"Amount: ${amount}", f"Risk: {fraud_score}/100", "Clear-cut case (rule-based)"],
+            "estimated_time_to_sell": "1-3 days" if should_tokenize else "n/a"
+        }
+    
+    def _fallback_marketplace(self, amount, fraud_score):
+        """Rule-based tokenization decision when AI fails"""
+        return {
                 "should_tokenize": amount >= 500 and fraud_score <= 30,
                 "confidence": 70,
                 "reasons": [f"Amount: ${amount}", f"Risk: {fraud_score}/100"],
@@ -7,42 +7,44 @@ from reportlab.pdfgen import canvas
 from datetime import datetime
 import random
 
+PAGE_WIDTH, PAGE_HEIGHT = letter
+
+# Static page content, built once; only the dynamic lines change per invoice
+TITLE = "TEST INVOICE"
+PARTIES = ["", "Supplier: Test Company Inc", "Customer: Demo Customer Ltd", "", "Items:"]
+
+
 def create_test_invoice():
-    filename = f"test_invoice_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+    now = datetime.now()
+    # Unique identifier using timestamp and random number
+    unique_id = f"INV-{now.strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
+    # Named after the id so invoices generated in the same second don't collide
+    filename = f"test_invoice_{unique_id[4:]}.pdf"
     
     # Create PDF
     c = canvas.Canvas(filename, pagesize=letter)
-    width, height = letter
     
     # Add content
     c.setFont("Helvetica-Bold", 20)
-    c.drawString(100, height - 100, "TEST INVOICE")
-    
-    c.setFont("Helvetica", 12)
-    y = height - 150
-    
-    # Unique identifier using timestamp and random number
-    unique_id = f"INV-{datetime.now().strftime('%Y%m%d%H%M%S')}-{random.randint(1000, 9999)}"
+    c.drawString(100, PAGE_HEIGHT - 100, TITLE)
     
     content = [
         f"Invoice Number: {unique_id}",
-        f"Date: {datetime.now().strftime('%Y-%m-%d')}",
-        "",
-        "Supplier: Test Company Inc",
-        "Customer: Demo Customer Ltd",
-        "",
-        "Items:",
+        f"Date: {now.strftime('%Y-%m-%d')}",
+        *PARTIES,
         f"  - Test Service ${random.randint(100, 500)}.00",
         f"  - Test Product ${random.randint(50, 200)}.00",
         "",
         f"Total: ${random.randint(150, 700)}.00 USD",
         "",
-        f"Generated: {datetime.now().isoformat()}",
+        f"Generated: {now.isoformat()}",
     ]
     
-    for line in content:
-        c.drawString(100, y, line)
-        y -= 20
+    # One text object (single BT/ET block) instead of a drawString per line
+    text = c.beginText(100, PAGE_HEIGHT - 150)
+    text.setFont("Helvetica", 12, leading=20)
+    text.textLines(content)
+    c.drawText(text)
     
     c.save()
     print(f"✅ Created: {filename}")
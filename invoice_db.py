@@ -0,0 +1,111 @@
+"""
+SQLite invoice store shared by the orchestrator and the agents.
+Replaces the old invoices_db.json, which had to be reparsed and rewritten
+in full for every save/update. The JSON file, if present, seeds a new DB.
+"""
+import os
+import json
+import sqlite3
+from pathlib import Path
+
+DB_FILE = "invoices.db"
+LEGACY_JSON_FILE = "invoices_db.json"
+
+COLUMNS = (
+    'invoice_number', 'supplier_name', 'total_amount', 'currency', 'date',
+    'document_hash', 'transaction_hash', 'timestamp', 'status', 'flags'
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoices (
+    id INTEGER PRIMARY KEY,
+    invoice_number TEXT,
+    supplier_name TEXT,
+    total_amount REAL,
+    currency TEXT,
+    date TEXT,
+    document_hash TEXT,
+    transaction_hash TEXT,
+    timestamp TEXT,
+    status TEXT,
+    flags TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_invoices_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS idx_invoices_status ON invoices (status);
+"""
+
+# Invoice numbers are not unique (duplicates are what fraud detection looks
+# for), so rows are keyed by id and invoice_number is only indexed
+
+
+def connect(db_file=DB_FILE):
+    """Open the invoice DB, creating (and seeding from JSON) on first use"""
+    is_new = not os.path.exists(db_file)
+    conn = sqlite3.connect(db_file)
+    conn.row_factory = sqlite3.Row
+    # WAL lets agents read while the orchestrator writes
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(_SCHEMA)
+
+    if is_new:
+        for record in read_legacy_json(db_file):
+            insert_invoice(conn, record, commit=False)
+        conn.commit()
+    return conn
+
+
+def connect_readonly(db_file=DB_FILE):
+    """Open an existing invoice DB read-only (no schema, WAL or seeding);
+    None if it does not exist yet"""
+    if not os.path.exists(db_file):
+        return None
+    uri = Path(db_file).resolve().as_uri()
+    conn = sqlite3.connect(f"{uri}?mode=ro", uri=True)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def read_legacy_json(db_file=DB_FILE):
+    """Records of the legacy JSON file next to db_file ([] if absent)"""
+    # Looked up next to the DB, not in the CWD
+    legacy_file = os.path.join(os.path.dirname(db_file), LEGACY_JSON_FILE)
+    if not os.path.exists(legacy_file):
+        return []
+    with open(legacy_file, 'r') as f:
+        return json.load(f)
+
+
+def insert_invoice(conn, record, commit=True):
+    """Append one invoice record (flags stored as JSON text)"""
+    values = [record.get(column) for column in COLUMNS]
+    values[-1] = json.dumps(record.get('flags') or [])
+    conn.execute(
+        f"INSERT INTO invoices ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+        values
+    )
+    if commit:
+        conn.commit()
+
+
+def update_invoice(conn, invoice_number, status, flags=None):
+    """Set status (and flags, if given) on the first record with this number"""
+    assignments = "status = ?"
+    params = [status]
+    if flags is not None:
+        assignments += ", flags = ?"
+        params.append(json.dumps(flags))
+    params.append(invoice_number)
+    conn.execute(
+        f"UPDATE invoices SET {assignments} WHERE id = "
+        "(SELECT id FROM invoices WHERE invoice_number = ? ORDER BY id LIMIT 1)",
+        params
+    )
+    conn.commit()
+
+
+def row_to_dict(row):
+    """Invoice row -> the record dict the agents used to read from JSON"""
+    record = {column: row[column] for column in row.keys() if column in COLUMNS}
+    if 'flags' in record:
+        record['flags'] = json.loads(record['flags'] or '[]')
+    return record
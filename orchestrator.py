@@ -1,22 +1,42 @@
 import os
-import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from dotenv import load_dotenv
+import orjson
 
 # Import our agents
 from agent import InvoiceAgent
 from agent_fraud_detection import FraudDetectionAgent
 from agent_reconciliation import PaymentReconciliationAgent
+import invoice_db
 
 load_dotenv()
 
+# Append-only workflow history, one compact JSON object per line
+REPORT_LOG_FILE = "workflow_reports.ndjson"
+_report_log = None
+
+
+def _append_report(report):
+    """Append a report to the NDJSON log (file opened once per process)."""
+    global _report_log
+    if _report_log is None:
+        _report_log = open(REPORT_LOG_FILE, 'ab', buffering=0)
+    _report_log.write(orjson.dumps(
+        report, default=str, option=orjson.OPT_APPEND_NEWLINE | orjson.OPT_SERIALIZE_NUMPY
+    ))
+
 class InvoiceProcessingOrchestrator:
     def __init__(self, mock_mode=True):
         self.mock_mode = mock_mode
+        self.db = invoice_db.connect()
         
         # Initialize all agents
         self.invoice_agent = InvoiceAgent(mock_mode=mock_mode)
         self.fraud_agent = FraudDetectionAgent()
+        # Fraud analysis overlaps blockchain registration; one worker keeps
+        # the fraud agent's SQLite connections on a single thread
+        self._fraud_executor = ThreadPoolExecutor(max_workers=1)
         self.reconciliation_agent = PaymentReconciliationAgent(
             contract_address=os.getenv('CONTRACT_ADDRESS', '0x0000000000000000000000000000000000000000'),
             mock_mode=mock_mode
@@ -45,7 +65,27 @@ class InvoiceProcessingOrchestrator:
         print(f"STAGE 1: Invoice Verification & Blockchain Registration")
         print(f"{'='*70}")
         
-        result = self.invoice_agent.process_invoice(invoice_path)
+        fields = self.invoice_agent.extract_fields(invoice_path)
+        
+        if fields is None:
+            print("\nInvoice verification failed. Workflow terminated.")
+            return None
+        
+        # ============================================================
+        # STAGE 2: Fraud Detection & Risk Analysis
+        # ============================================================
+        # Needs only the extracted fields, so it runs while the
+        # registration transaction is being confirmed
+        print(f"\n{'='*70}")
+        print(f"STAGE 2: Fraud Detection & Risk Analysis (parallel with registration)")
+        print(f"{'='*70}")
+        
+        analysis, doc_hash = fields
+        fraud_future = self._fraud_executor.submit(
+            self.fraud_agent.analyze_invoice, {'analysis': analysis}
+        )
+        result = self.invoice_agent.submit_and_wait(invoice_path, analysis, doc_hash)
+        fraud_report = fraud_future.result()
         
         if not result:
             print("\nInvoice verification failed. Workflow terminated.")
@@ -54,15 +94,52 @@ class InvoiceProcessingOrchestrator:
         # Save to database
         self.save_to_database(result)
         
-        # ============================================================
-        # STAGE 2: Fraud Detection & Risk Analysis
-        # ============================================================
+        return self._finish_workflow(result, fraud_report)
+    
+    def process_invoices_batch(self, invoice_paths):
+        """
+        Full workflow for many invoices. Fields are extracted per invoice and
+        registered in one batch, then fraud analysis for the whole batch shares one concurrent round of
+        Gemini calls instead of one blocking call per invoice. As in the
+        single-invoice workflow, invoices are saved after fraud analysis,
+        so none is compared against its own record.
+        """
+        print(f"\nStarting Batch Workflow: {len(invoice_paths)} invoice(s)\n")
+        
+        print(f"\n{'='*70}")
+        print(f"STAGE 1: Invoice Verification & Blockchain Registration")
+        print(f"{'='*70}")
+        
+        # Fields are extracted per invoice, then all registrations go out
+        # in one nonce-ahead register_many
+        results = []
+        for invoice_path, result in zip(
+            invoice_paths, self.invoice_agent.process_invoices(invoice_paths)
+        ):
+            if not result:
+                print(f"\nInvoice verification failed for {os.path.basename(invoice_path)}. Skipping.")
+                continue
+            results.append(result)
+        
+        if not results:
+            return []
+        
         print(f"\n{'='*70}")
         print(f"STAGE 2: Fraud Detection & Risk Analysis")
         print(f"{'='*70}")
         
-        fraud_report = self.fraud_agent.analyze_invoice(result)
+        fraud_reports = self._fraud_executor.submit(
+            self.fraud_agent.analyze_invoices, results
+        ).result()
         
+        reports = []
+        for result, fraud_report in zip(results, fraud_reports):
+            self.save_to_database(result)
+            reports.append(self._finish_workflow(result, fraud_report))
+        return reports
+    
+    def _finish_workflow(self, result, fraud_report):
+        """Apply the fraud verdict, then report on one verified invoice"""
         # Add fraud analysis to result
         result['fraud_analysis'] = fraud_report
         
@@ -122,24 +199,14 @@ class InvoiceProcessingOrchestrator:
             'workflow_complete': True
         }
         
-        report_file = f"workflow_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(report_file, 'w') as f:
-            json.dump(workflow_report, f, indent=2)
+        _append_report(workflow_report)
         
-        print(f"\nComplete workflow report: {report_file}")
+        print(f"\nComplete workflow report appended to: {REPORT_LOG_FILE}")
         
         return workflow_report
     
     def save_to_database(self, invoice_result):
         """Save invoice to persistent database"""
-        db_file = "invoices_db.json"
-        
-        try:
-            with open(db_file, 'r') as f:
-                db = json.load(f)
-        except FileNotFoundError:
-            db = []
-        
         # Add new invoice
         invoice_record = {
             'invoice_number': invoice_result.get('analysis', {}).get('invoice_number'),
@@ -154,38 +221,22 @@ class InvoiceProcessingOrchestrator:
             'flags': []
         }
         
-        db.append(invoice_record)
-        
-        with open(db_file, 'w') as f:
-            json.dump(db, f, indent=2)
+        invoice_db.insert_invoice(self.db, invoice_record)
         
         print("\nInvoice saved to database")
     
     def update_database(self, invoice_result):
         """Update existing invoice in database"""
-        db_file = "invoices_db.json"
-        
-        try:
-            with open(db_file, 'r') as f:
-                db = json.load(f)
-            
-            # Find and update
-            invoice_num = invoice_result.get('analysis', {}).get('invoice_number')
-            for record in db:
-                if record['invoice_number'] == invoice_num:
-                    record['status'] = invoice_result.get('status')
-                    if invoice_result.get('fraud_analysis'):
-                        record['flags'] = [
-                            issue.get('reason', 'Unknown issue') 
-                            for issue in invoice_result['fraud_analysis'].get('detected_issues', [])
-                        ]
-                    break
-            
-            with open(db_file, 'w') as f:
-                json.dump(db, f, indent=2)
-                
-        except FileNotFoundError:
-            pass
+        invoice_num = invoice_result.get('analysis', {}).get('invoice_number')
+        flags = None
+        if invoice_result.get('fraud_analysis'):
+            flags = [
+                issue.get('reason', 'Unknown issue') 
+                for issue in invoice_result['fraud_analysis'].get('detected_issues', [])
+            ]
+        
+        # Indexed lookup of the first record with this number
+        invoice_db.update_invoice(self.db, invoice_num, invoice_result.get('status'), flags)
     
     def run_payment_reconciliation(self, wallet_address):
         """Run payment reconciliation for all pending invoices"""
@@ -201,7 +252,7 @@ if __name__ == "__main__":
     
     if len(sys.argv) < 2:
         print("\nUsage:")
-        print("   Process invoice:  python orchestrator.py <invoice.pdf>")
+        print("   Process invoice:  python orchestrator.py <invoice.pdf> [more.pdf ...]")
         print("   Reconcile payments: python orchestrator.py --reconcile <wallet_address>")
         print("\n   Add --live flag for real blockchain transactions")
         sys.exit(1)
@@ -224,14 +275,20 @@ if __name__ == "__main__":
     
     # Invoice processing mode
     else:
-        invoice_path = sys.argv[1]
-        # Resolve sample_invoice.pdf -> sample_invoice.pdf.pdf if needed
-        if not os.path.exists(invoice_path):
-            for cand in [f"{invoice_path}.pdf", invoice_path + ".pdf"]:
-                if cand != invoice_path and os.path.exists(cand):
-                    invoice_path = cand
-                    break
-        if not os.path.exists(invoice_path):
-            print(f"Error: File not found: {invoice_path}")
-            sys.exit(1)
-        orchestrator.process_invoice_full_workflow(invoice_path)
\ No newline at end of file
+        invoice_paths = []
+        for invoice_path in sys.argv[1:]:
+            # Resolve sample_invoice.pdf -> sample_invoice.pdf.pdf if needed
+            if not os.path.exists(invoice_path):
+                for cand in [f"{invoice_path}.pdf", invoice_path + ".pdf"]:
+                    if cand != invoice_path and os.path.exists(cand):
+                        invoice_path = cand
+                        break
+            if not os.path.exists(invoice_path):
+                print(f"Error: File not found: {invoice_path}")
+                sys.exit(1)
+            invoice_paths.append(invoice_path)
+        
+        if len(invoice_paths) == 1:
+            orchestrator.process_invoice_full_workflow(invoice_paths[0])
+        else:
+            orchestrator.process_invoices_batch(invoice_paths)
\ No newline at end of file
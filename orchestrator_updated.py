@@ -3,8 +3,126 @@ Multi-Agent Invoice Processing Orchestrator with NFT Tokenization
 Coordinates: Verification → Fraud Detection → Tokenization → Reconciliation
 """
 import sys
-from agent import InvoiceAgent
-from agent_tokenization import InvoiceTokenizationAgent
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import time
+import orjson
+
+# The agents (web3, Gemini, PDF backends) are imported in
+# InvoiceOrchestrator.__init__, so usage/--demo start without them
+
+# Concurrent invoices per blocking stage in process_invoices_batch
+PIPELINE_WORKERS = 4
+
+
+def _risk_line(fraud_score):
+    """Risk verdict printed for a fraud score"""
+    if fraud_score > 50:
+        return "⚠️  HIGH RISK - Manual review recommended"
+    elif fraud_score > 30:
+        return "⚠️  MEDIUM RISK - Proceed with caution"
+    return "✓ LOW RISK - Safe to proceed"
+
+
+# (fraud_score, verdict) by issue count; 10 points per issue, capped at 100
+_RISK_TABLE = tuple((i * 10, _risk_line(i * 10)) for i in range(11))
+
+# Printed after a successful tokenization (filled with format_map)
+_SUMMARY_TMPL = "\n" + "="*70 + """
+✅ INVOICE SUCCESSFULLY TOKENIZED!
+""" + "="*70 + """
+
+📊 SUMMARY:
+  Original Invoice: {invoice_file}
+  Document Hash: {document_hash_short}
+  Blockchain TX: {transaction_hash}
+  NFT Token ID: #{token_id}
+  Face Value: ${face_value}
+  Listed Price: ${listed_price}
+  Discount: {discount}%
+  Risk Score: {fraud_score}/100
+
+💡 Buyers can purchase this invoice at a discount
+   and collect the full amount when the invoice is paid!"""
+
+# Static marketplace overview for --demo / no-argument runs
+_DEMO_BANNER = "\n" + "="*70 + """
+  INVOICE NFT MARKETPLACE DEMO
+""" + "="*70 + """
+
+        🏪 MARKETPLACE FEATURES:
+        
+        1. TOKENIZATION
+           - Convert verified invoices into tradeable NFTs
+           - Each NFT represents claim to invoice payment
+        
+        2. AI PRICING
+           - Analyze risk, time to maturity, supplier history
+           - Calculate optimal discount for early payment
+           - Market-competitive rates
+        
+        3. TRADING
+           - Suppliers get immediate cash (at discount)
+           - Buyers get profitable investment
+           - Smart contract handles settlement
+        
+        4. REDEMPTION
+           - When invoice paid → NFT holder gets full amount
+           - Automatic profit calculation
+           - Blockchain-verified settlement
+        
+        📈 EXAMPLE TRADE:
+           Invoice Face Value: $10,000
+           AI Recommended Price: $9,500 (5% discount)
+           
+           Supplier: Gets $9,500 immediately
+           Buyer: Pays $9,500, gets $10,000 → $500 profit
+           
+        🔐 SECURITY:
+           - Fraud detection filters risky invoices
+           - Smart contract escrow
+           - Immutable blockchain records
+        
+"""
+
+# One orchestrator and one event loop per --jobs worker process, built on
+# its first invoice. The async Gemini and Web3 clients bind to the loop
+# they are first used on, so every invoice in a worker runs on that loop
+# (a fresh asyncio.run per invoice would leave them tied to a closed one)
+_worker_orchestrator = None
+_worker_loop = None
+
+
+def _process_in_worker(invoice_path, mock_mode, enable_tokenization):
+    """ProcessPoolExecutor entry point: full flow for one invoice"""
+    global _worker_orchestrator, _worker_loop
+    if _worker_orchestrator is None:
+        _worker_orchestrator = InvoiceOrchestrator(mock_mode=mock_mode)
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop.run_until_complete(
+        _worker_orchestrator.aprocess_invoice_full_flow(invoice_path, enable_tokenization)
+    )
+
+
+def process_invoices_in_processes(invoice_paths, jobs, mock_mode=True, enable_tokenization=True):
+    """
+    Full flow for many invoices across `jobs` worker processes, so CPU-bound
+    PDF parsing and hashing use several cores. Results in input order, with
+    an exception object in place of any invoice that raised
+    """
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [
+            executor.submit(_process_in_worker, invoice_path, mock_mode, enable_tokenization)
+            for invoice_path in invoice_paths
+        ]
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
 
 class InvoiceOrchestrator:
     def __init__(self, mock_mode=True):
@@ -14,13 +132,81 @@ class InvoiceOrchestrator:
         print("="*70)
         print(f"Mode: {'MOCK (simulated blockchain)' if mock_mode else 'LIVE (real blockchain)'}\n")
         
+        from agent import InvoiceAgent
+        from agent_tokenization import InvoiceTokenizationAgent
+        
         # Initialize agents
         print("Initializing agents...")
         self.verification_agent = InvoiceAgent(mock_mode=mock_mode)
         self.tokenization_agent = InvoiceTokenizationAgent(mock_mode=mock_mode)
+        # (document_hash, fraud_score) -> marketplace analysis, so retries and
+        # repeated invoices skip the analysis (the agent's SQLite prompt
+        # cache already persists answers across runs)
+        self._analysis_cache = {}
         print("✓ All agents ready\n")
     
     def process_invoice_full_flow(self, invoice_path, enable_tokenization=True):
+        """Blocking aprocess_invoice_full_flow for a single invoice"""
+        return asyncio.run(self.aprocess_invoice_full_flow(invoice_path, enable_tokenization))
+    
+    async def process_invoices_batch(self, invoice_paths, enable_tokenization=True):
+        """
+        Full flow for many invoices as a verify -> fraud -> tokenize
+        pipeline: invoice N+1 is verified while N is scored and tokenized.
+        Results in input order, with an exception object in place of any
+        invoice that raised
+        """
+        results = [None] * len(invoice_paths)
+        verify_q, fraud_q, tokenize_q = asyncio.Queue(), asyncio.Queue(), asyncio.Queue()
+        
+        async def fraud(result):
+            return result, self._fraud_stage(result)
+        
+        async def tokenize(item):
+            result, fraud_score = item
+            if enable_tokenization:
+                await self._tokenize_stage(result, fraud_score)
+            return result
+        
+        async def worker(inbox, outbox, work):
+            # Items carry their input position so results keep input order
+            while True:
+                seq, item = await inbox.get()
+                try:
+                    out = await work(item)
+                    if out is None:
+                        pass  # verification failed; result stays None
+                    elif outbox is None:
+                        results[seq] = out
+                    else:
+                        outbox.put_nowait((seq, out))
+                except Exception as e:
+                    results[seq] = e
+                finally:
+                    inbox.task_done()
+        
+        workers = [
+            asyncio.create_task(worker(verify_q, fraud_q, self._verify_stage))
+            for _ in range(PIPELINE_WORKERS)
+        ] + [
+            asyncio.create_task(worker(fraud_q, tokenize_q, fraud))
+        ] + [
+            asyncio.create_task(worker(tokenize_q, None, tokenize))
+            for _ in range(PIPELINE_WORKERS)
+        ]
+        
+        for seq, invoice_path in enumerate(invoice_paths):
+            verify_q.put_nowait((seq, invoice_path))
+        # Each stage only receives work from the one before, so joining in
+        # order drains the whole pipeline
+        for queue in (verify_q, fraud_q, tokenize_q):
+            await queue.join()
+        for task in workers:
+            task.cancel()
+        
+        return results
+    
+    async def aprocess_invoice_full_flow(self, invoice_path, enable_tokenization=True):
         """
         Complete invoice processing workflow:
         1. Verification & Registration
@@ -28,177 +214,187 @@ class InvoiceOrchestrator:
         3. Tokenization (optional)
         4. Marketplace Listing
         """
-        print("="*70)
-        print(f"PROCESSING: {invoice_path}")
-        print("="*70)
+        result = await self._verify_stage(invoice_path)
+        if not result:
+            return None
+        
+        fraud_score = self._fraud_stage(result)
+        
+        if enable_tokenization:
+            await self._tokenize_stage(result, fraud_score)
         
-        # STEP 1: Verification & Blockchain Registration
-        print("\n🔍 STEP 1: VERIFICATION & REGISTRATION")
-        print("-" * 70)
-        result = self.verification_agent.process_invoice(invoice_path)
+        return result
+    
+    async def _verify_stage(self, invoice_path):
+        """Step 1; the verified result, or None"""
+        # Each stage's output is built up and written with one print, so
+        # concurrent invoices don't interleave line by line
+        print("\n".join([
+            "="*70,
+            f"PROCESSING: {invoice_path}",
+            "="*70,
+            # STEP 1: Verification & Blockchain Registration
+            "\n🔍 STEP 1: VERIFICATION & REGISTRATION",
+            "-" * 70
+        ]))
+        # Blocking agent (PDF parse, Gemini, receipt wait) runs in a worker thread
+        result = await asyncio.to_thread(self.verification_agent.process_invoice, invoice_path)
         
         if not result:
             print("\n❌ Verification failed. Stopping workflow.")
             return None
-        
-        invoice_hash = result['document_hash']
+        return result
+    
+    def _fraud_stage(self, result):
+        """Step 2; fraud score from the verifier's potential_issues"""
         invoice_data = result['analysis']
         
         # STEP 2: Fraud Detection (from potential_issues)
-        print("\n🚨 STEP 2: FRAUD DETECTION")
-        print("-" * 70)
-        
         issues = invoice_data.get('potential_issues', [])
-        fraud_score = len(issues) * 10  # Simple scoring: 10 points per issue
-        fraud_score = min(fraud_score, 100)
-        
-        print(f"Risk Score: {fraud_score}/100")
-        if fraud_score > 50:
-            print("⚠️  HIGH RISK - Manual review recommended")
-        elif fraud_score > 30:
-            print("⚠️  MEDIUM RISK - Proceed with caution")
-        else:
-            print("✓ LOW RISK - Safe to proceed")
+        fraud_score, verdict = _RISK_TABLE[min(len(issues), 10)]
         
-        print(f"Issues detected: {len(issues)}")
-        for issue in issues:
-            print(f"  - {issue}")
+        lines = [
+            "\n🚨 STEP 2: FRAUD DETECTION",
+            "-" * 70,
+            f"Risk Score: {fraud_score}/100",
+            verdict,
+            f"Issues detected: {len(issues)}"
+        ]
+        lines.extend(f"  - {issue}" for issue in issues)
+        print("\n".join(lines))
+        return fraud_score
+    
+    async def _tokenize_stage(self, result, fraud_score):
+        """Steps 3-4; records tokenization/marketplace_ready on result"""
+        invoice_hash = result['document_hash']
+        invoice_data = result['analysis']
         
         # STEP 3: Tokenization Decision
-        if enable_tokenization:
-            print("\n💎 STEP 3: NFT TOKENIZATION ANALYSIS")
-            print("-" * 70)
-            
-            analysis = self.tokenization_agent.analyze_marketplace_opportunity(
+        key = (invoice_hash, fraud_score)
+        analysis = self._analysis_cache.get(key)
+        if analysis is None:
+            analysis = await self.tokenization_agent.analyze_marketplace_opportunity_async(
                 invoice_data,
                 fraud_score
             )
+            self._analysis_cache[key] = analysis
+        
+        lines = [
+            "\n💎 STEP 3: NFT TOKENIZATION ANALYSIS",
+            "-" * 70,
+            f"Should tokenize: {'YES' if analysis['should_tokenize'] else 'NO'}",
+            f"Confidence: {analysis['confidence']}%",
+            "Reasons:"
+        ]
+        lines.extend(f"  - {reason}" for reason in analysis.get('reasons', []))
+        print("\n".join(lines))
+        
+        if analysis['should_tokenize']:
+            print("\n💰 STEP 4: TOKENIZING & LISTING\n" + "-" * 70)
             
-            print(f"Should tokenize: {'YES' if analysis['should_tokenize'] else 'NO'}")
-            print(f"Confidence: {analysis['confidence']}%")
-            print(f"Reasons:")
-            for reason in analysis.get('reasons', []):
-                print(f"  - {reason}")
+            token_result = await self.tokenization_agent.tokenize_invoice_async(
+                invoice_hash,
+                invoice_data,
+                fraud_score
+            )
             
-            if analysis['should_tokenize']:
-                print(f"\n💰 STEP 4: TOKENIZING & LISTING")
-                print("-" * 70)
+            if token_result and token_result['success']:
+                result['tokenization'] = token_result
+                result['marketplace_ready'] = True
                 
-                token_result = self.tokenization_agent.tokenize_invoice(
-                    invoice_hash,
-                    invoice_data,
-                    fraud_score
-                )
+                print(_SUMMARY_TMPL.format_map({
+                    **result,
+                    **token_result,
+                    'document_hash_short': f"{invoice_hash[:16]}...{invoice_hash[-16:]}",
+                    'fraud_score': fraud_score
+                }))
                 
-                if token_result and token_result['success']:
-                    result['tokenization'] = token_result
-                    result['marketplace_ready'] = True
-                    
-                    print("\n" + "="*70)
-                    print("✅ INVOICE SUCCESSFULLY TOKENIZED!")
-                    print("="*70)
-                    print(f"\n📊 SUMMARY:")
-                    print(f"  Original Invoice: {result['invoice_file']}")
-                    print(f"  Document Hash: {invoice_hash[:16]}...{invoice_hash[-16:]}")
-                    print(f"  Blockchain TX: {result['transaction_hash']}")
-                    print(f"  NFT Token ID: #{token_result['token_id']}")
-                    print(f"  Face Value: ${token_result['face_value']}")
-                    print(f"  Listed Price: ${token_result['listed_price']}")
-                    print(f"  Discount: {token_result['discount']}%")
-                    print(f"  Risk Score: {fraud_score}/100")
-                    print(f"\n💡 Buyers can purchase this invoice at a discount")
-                    print(f"   and collect the full amount when the invoice is paid!")
-                    
-                else:
-                    print("\n⚠️  Tokenization failed, but verification succeeded")
             else:
-                print(f"\n⏭️  Skipping tokenization (not recommended for this invoice)")
-                result['marketplace_ready'] = False
-        
-        return result
+                print("\n⚠️  Tokenization failed, but verification succeeded")
+        else:
+            print(f"\n⏭️  Skipping tokenization (not recommended for this invoice)")
+            result['marketplace_ready'] = False
     
-    def demo_marketplace(self):
+    @staticmethod
+    def demo_marketplace():
         """
         Demo of marketplace functionality
         """
-        print("\n" + "="*70)
-        print("  INVOICE NFT MARKETPLACE DEMO")
-        print("="*70)
-        print("""
-        🏪 MARKETPLACE FEATURES:
-        
-        1. TOKENIZATION
-           - Convert verified invoices into tradeable NFTs
-           - Each NFT represents claim to invoice payment
-        
-        2. AI PRICING
-           - Analyze risk, time to maturity, supplier history
-           - Calculate optimal discount for early payment
-           - Market-competitive rates
-        
-        3. TRADING
-           - Suppliers get immediate cash (at discount)
-           - Buyers get profitable investment
-           - Smart contract handles settlement
-        
-        4. REDEMPTION
-           - When invoice paid → NFT holder gets full amount
-           - Automatic profit calculation
-           - Blockchain-verified settlement
-        
-        📈 EXAMPLE TRADE:
-           Invoice Face Value: $10,000
-           AI Recommended Price: $9,500 (5% discount)
-           
-           Supplier: Gets $9,500 immediately
-           Buyer: Pays $9,500, gets $10,000 → $500 profit
-           
-        🔐 SECURITY:
-           - Fraud detection filters risky invoices
-           - Smart contract escrow
-           - Immutable blockchain records
-        """)
+        sys.stdout.write(_DEMO_BANNER)
 
 if __name__ == "__main__":
     # Check arguments
     if len(sys.argv) < 2:
         print("\n📚 USAGE:")
-        print("  python orchestrator_updated.py <invoice.pdf> [--live] [--no-tokenize]")
+        print("  python orchestrator_updated.py <invoice.pdf> [more.pdf ...] [--live] [--no-tokenize]")
         print("\nEXAMPLES:")
         print("  python orchestrator_updated.py sample_invoice.pdf")
         print("  python orchestrator_updated.py sample_invoice.pdf --live")
         print("  python orchestrator_updated.py sample_invoice.pdf --live --no-tokenize")
+        print("  python orchestrator_updated.py a.pdf b.pdf c.pdf   (processed concurrently)")
+        print("  python orchestrator_updated.py a.pdf b.pdf c.pdf --jobs 4")
         print("\nFLAGS:")
         print("  --live          Use real blockchain (requires tBNB)")
         print("  --no-tokenize   Skip NFT tokenization step")
         print("  --demo          Show marketplace demo")
+        print("  --jobs N        Spread invoices over N processes (mock mode only)")
         
         # Show demo by default
-        orchestrator = InvoiceOrchestrator(mock_mode=True)
-        orchestrator.demo_marketplace()
+        InvoiceOrchestrator.demo_marketplace()
         sys.exit(0)
     
     # Parse arguments
-    invoice_path = sys.argv[1]
+    args = sys.argv[1:]
+    jobs = 1
+    if "--jobs" in args:
+        at = args.index("--jobs")
+        try:
+            jobs = max(1, int(args[at + 1]))
+        except (IndexError, ValueError):
+            print("\n❌ --jobs needs a number of processes")
+            sys.exit(1)
+        del args[at:at + 2]
+    invoice_paths = [arg for arg in args if not arg.startswith("--")]
     mock_mode = "--live" not in sys.argv
     enable_tokenization = "--no-tokenize" not in sys.argv
     
     if "--demo" in sys.argv:
-        orchestrator = InvoiceOrchestrator(mock_mode=True)
-        orchestrator.demo_marketplace()
+        InvoiceOrchestrator.demo_marketplace()
         sys.exit(0)
     
+    if not invoice_paths:
+        print("\n❌ No invoice file given")
+        sys.exit(1)
+    
+    if jobs > 1 and not mock_mode:
+        # Separate processes would each track the wallet nonce on their own
+        print("\n⚠️  --jobs is ignored in live mode (one wallet, one nonce sequence)")
+        jobs = 1
+    
     # Run full workflow
-    orchestrator = InvoiceOrchestrator(mock_mode=mock_mode)
-    result = orchestrator.process_invoice_full_flow(invoice_path, enable_tokenization)
+    if len(invoice_paths) > 1:
+        if jobs > 1:
+            results = process_invoices_in_processes(invoice_paths, jobs, mock_mode, enable_tokenization)
+        else:
+            orchestrator = InvoiceOrchestrator(mock_mode=mock_mode)
+            results = asyncio.run(orchestrator.process_invoices_batch(invoice_paths, enable_tokenization))
+        for invoice_path, outcome in zip(invoice_paths, results):
+            if isinstance(outcome, Exception):
+                print(f"\n❌ {invoice_path}: {outcome}")
+        results = [outcome for outcome in results if outcome and not isinstance(outcome, Exception)]
+    else:
+        orchestrator = InvoiceOrchestrator(mock_mode=mock_mode)
+        result = orchestrator.process_invoice_full_flow(invoice_paths[0], enable_tokenization)
+        results = [result] if result else []
     
-    if result:
+    if results:
         # Save enhanced results
-        import json
-        from datetime import datetime
-        
-        output_file = f"tokenization_result_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(output_file, 'w') as f:
-            json.dump(result, f, indent=2)
+        # Nanosecond stamp: unique even when runs finish in the same second
+        output_file = f"tokenization_result_{time.time_ns()}.json"
+        with open(output_file, 'wb') as f:
+            f.write(orjson.dumps(
+                results[0] if len(invoice_paths) == 1 else results,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY
+            ))
         
         print(f"\n📄 Full results saved to: {output_file}")
@@ -1,15 +1,29 @@
 import os
-import json
+import re
+from functools import lru_cache
 from pathlib import Path
 
+import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
 from web3 import Web3
 
+import invoice_db
 from agent import CONTRACT_ABI, CONTRACT_ADDRESS
 
+DEFAULT_RPC_URL = "https://data-seed-prebsc-1-s1.binance.org:8545/"
 
+# Exactly 64 hex digits (a bytes32 document hash)
+_HEX64 = re.compile(r"[0-9a-fA-F]{64}\Z").match
+
+
+@lru_cache(maxsize=None)
 def _load_env() -> None:
-    """Load environment variables from .env / .env.txt next to this file."""
+    """
+    Load environment variables from .env / .env.txt next to this file.
+
+    Runs once per process; repeated main() calls skip the file checks.
+    """
     script_dir = Path(__file__).resolve().parent
 
     # Load default environment (if any)
@@ -21,41 +35,71 @@ def _load_env() -> None:
             load_dotenv(dotenv_path=p, override=False)
 
 
-def _connect_web3() -> Web3:
-    """Create a Web3 HTTP client for BSC Testnet."""
-    rpc_url = os.getenv(
-        "BSC_TESTNET_RPC",
-        "https://data-seed-prebsc-1-s1.binance.org:8545/",
+@lru_cache(maxsize=4)
+def _connect_web3(rpc_url: str) -> Web3:
+    """
+    Web3 HTTP client for BSC Testnet, one per RPC URL.
+
+    Uses a keep-alive session, so every call after the first reuses the
+    same TCP/TLS connection.
+    """
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_connections=8, pool_maxsize=32))
+    return Web3(Web3.HTTPProvider(
+        rpc_url,
+        session=session,
+        request_kwargs={"timeout": 10},
+    ))
+
+
+@lru_cache(maxsize=4)
+def _get_contract(rpc_url: str, address: str):
+    """
+    Contract instance for CONTRACT_ABI, one per (RPC URL, address).
+
+    The ABI is a fixed module constant, so it is not part of the key; the
+    EIP-55 checksum is computed once here rather than per call.
+    """
+    return _connect_web3(rpc_url).eth.contract(
+        address=Web3.to_checksum_address(address),
+        abi=CONTRACT_ABI,
     )
-    w3 = Web3(Web3.HTTPProvider(rpc_url))
-    return w3
 
 
-def _load_latest_invoice_hash() -> str | None:
+def _load_latest_invoice_hash() -> bytes | None:
     """
-    Try to load the most recent real-looking document hash from invoices_db.json.
+    Try to load the most recent real-looking document hash from the invoice DB
+    (or, before it exists, the legacy JSON file it would be seeded from).
 
-    Returns a 64-char hex string if found, otherwise None.
+    Returns the 32 hash bytes if found, otherwise None.
     """
-    db_path = Path(__file__).with_name("invoices_db.json")
-    if not db_path.exists():
-        return None
+    db_path = str(Path(__file__).resolve().with_name(invoice_db.DB_FILE))
 
     try:
-        with db_path.open("r", encoding="utf-8") as f:
-            invoices = json.load(f)
+        # Read-only: this test must not create, migrate or seed the DB
+        conn = invoice_db.connect_readonly(db_path)
+        if conn is not None:
+            try:
+                # SQLite filters to 64 hex digits and returns only the newest
+                # match (uses the id primary key; no full scan into Python)
+                row = conn.execute(
+                    "SELECT document_hash FROM invoices "
+                    "WHERE length(document_hash) = 64 "
+                    "AND document_hash NOT GLOB '*[^0-9a-fA-F]*' "
+                    "ORDER BY id DESC LIMIT 1"
+                ).fetchone()
+            finally:
+                conn.close()
+            hashes = [row[0]] if row is not None else []
+        else:
+            # No DB yet: the legacy JSON it would be seeded from
+            hashes = [entry.get("document_hash") for entry in reversed(invoice_db.read_legacy_json(db_path))]
     except Exception:
         return None
 
-    # Iterate from the end (most recent) to find a 64-char hex hash
-    for entry in reversed(invoices):
-        h = entry.get("document_hash")
-        if isinstance(h, str) and len(h) == 64:
-            try:
-                int(h, 16)
-                return h
-            except ValueError:
-                continue
+    for h in hashes:
+        if isinstance(h, str) and _HEX64(h):
+            return bytes.fromhex(h)
     return None
 
 
@@ -64,11 +108,8 @@ def main() -> None:
 
     _load_env()
 
-    w3 = _connect_web3()
-    rpc_url = os.getenv(
-        "BSC_TESTNET_RPC",
-        "https://data-seed-prebsc-1-s1.binance.org:8545/",
-    )
+    rpc_url = os.getenv("BSC_TESTNET_RPC", DEFAULT_RPC_URL)
+    w3 = _connect_web3(rpc_url)
     print(f"RPC URL: {rpc_url}")
 
     if not w3.is_connected():
@@ -101,44 +142,44 @@ def main() -> None:
 
     # Instantiate contract
     try:
-        contract = w3.eth.contract(
-            address=Web3.to_checksum_address(CONTRACT_ADDRESS),
-            abi=CONTRACT_ABI,
-        )
+        contract = _get_contract(rpc_url, CONTRACT_ADDRESS)
         print("[OK] Contract instance created")
     except Exception as e:
         print(f"[X] Failed to create contract instance: {e}")
         return
 
     # Try verifying the latest known invoice hash (if any)
-    doc_hash = _load_latest_invoice_hash()
-    if not doc_hash:
-        print("[!] No suitable 64-char hex document_hash found in invoices_db.json")
+    hash_bytes = _load_latest_invoice_hash()
+    if not hash_bytes:
+        print(f"[!] No suitable 64-char hex document_hash found in {invoice_db.DB_FILE}")
         print("    Skipping on-chain invoice verification test.")
         return
 
-    print(f"[OK] Using document_hash from invoices_db.json: {doc_hash}")
-
-    try:
-        hash_bytes = bytes.fromhex(doc_hash)
-    except ValueError as e:
-        print(f"[X] document_hash is not valid hex: {e}")
-        return
+    print(f"[OK] Using document_hash from {invoice_db.DB_FILE}: {hash_bytes.hex()}")
 
-    # Call verifyInvoice (view)
+    # verifyInvoice and getInvoice (views) in one JSON-RPC batch; one
+    # failing call (getInvoice may revert for unknown hashes) sinks the
+    # whole batch, so fall back to calling them one by one
+    invoice = None
     try:
-        exists = contract.functions.verifyInvoice(hash_bytes).call()
-        print(f"[OK] verifyInvoice(...) returned: {exists}")
-    except Exception as e:
-        print(f"[X] verifyInvoice call failed: {e}")
-        return
+        with w3.batch_requests() as batch:
+            batch.add(contract.functions.verifyInvoice(hash_bytes))
+            batch.add(contract.functions.getInvoice(hash_bytes))
+            exists, invoice = batch.execute()
+    except Exception:
+        try:
+            exists = contract.functions.verifyInvoice(hash_bytes).call()
+        except Exception as e:
+            print(f"[X] verifyInvoice call failed: {e}")
+            return
+    print(f"[OK] verifyInvoice(...) returned: {exists}")
 
     # If it exists, fetch full invoice metadata
     if exists:
         try:
-            timestamp, registrar, metadata = contract.functions.getInvoice(
-                hash_bytes
-            ).call()
+            if invoice is None:
+                invoice = contract.functions.getInvoice(hash_bytes).call()
+            timestamp, registrar, metadata = invoice
             print("[OK] getInvoice(...) result:")
             print(f"   timestamp: {timestamp}")
             print(f"   registrar: {registrar}")
@@ -0,0 +1,129 @@
+"""
+Single-invoice and batch fraud analysis must reach the same verdicts.
+
+The orchestrator saves each invoice after its fraud analysis in both
+workflows; these tests replay that order against a scratch database, with
+the Gemini calls replaced by a fixed 'review' verdict.
+"""
+import os
+import sys
+import tempfile
+import unittest
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import invoice_db
+from agent_fraud_detection import FraudDetectionAgent
+
+AI_VERDICT = {
+    'additional_indicators': [],
+    'fraud_probability': 'medium',
+    'recommended_action': 'review',
+    'explanation': 'test verdict'
+}
+
+
+def _invoice(number, supplier="Acme Supplies", amount="1234.56"):
+    return {'analysis': {
+        'invoice_number': number,
+        'supplier_name': supplier,
+        'total_amount': amount,
+        'currency': 'USD',
+        'date': '2026-01-15'
+    }}
+
+
+def _save(conn, invoice_data):
+    """Same record orchestrator.save_to_database writes"""
+    analysis = invoice_data['analysis']
+    invoice_db.insert_invoice(conn, {
+        'invoice_number': analysis['invoice_number'],
+        'supplier_name': analysis['supplier_name'],
+        'total_amount': analysis['total_amount'],
+        'currency': analysis['currency'],
+        'date': analysis['date'],
+        'timestamp': datetime.now().isoformat(),
+        'status': 'pending',
+        'flags': []
+    })
+
+
+def _verdict(report):
+    """The parts of a report the orchestrator's status decision reads"""
+    return (
+        sorted(issue['type'] for issue in report['detected_issues'] if 'type' in issue),
+        len(report['detected_issues']),
+        report['ai_analysis']['recommended_action']
+    )
+
+
+class FraudVerdictConsistencyTest(unittest.TestCase):
+    def setUp(self):
+        # DB, AI cache and report log all live in the working directory
+        self._cwd = os.getcwd()
+        self._tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        os.chdir(self._cwd)
+        self._tmp.cleanup()
+
+    def _agent(self):
+        agent = FraudDetectionAgent()
+        agent.analyze_with_ai = lambda invoice, issues: dict(AI_VERDICT)
+        agent.analyze_invoices_batch = lambda items: [dict(AI_VERDICT) for _ in items]
+        return agent
+
+    def _workdir(self, name):
+        """Fresh working directory (own invoices.db) for one path"""
+        path = os.path.join(self._tmp.name, name)
+        os.mkdir(path)
+        os.chdir(path)
+
+    def _run_single(self, invoice_datas, history=()):
+        self._workdir("single")
+        conn = invoice_db.connect()
+        for invoice_data in history:
+            _save(conn, invoice_data)
+        agent = self._agent()
+        verdicts = []
+        for invoice_data in invoice_datas:
+            verdicts.append(_verdict(agent.analyze_invoice(invoice_data)))
+            _save(conn, invoice_data)
+        conn.close()
+        return verdicts
+
+    def _run_batch(self, invoice_datas, history=()):
+        self._workdir("batch")
+        conn = invoice_db.connect()
+        for invoice_data in history:
+            _save(conn, invoice_data)
+        agent = self._agent()
+        reports = agent.analyze_invoices(invoice_datas)
+        for invoice_data in invoice_datas:
+            _save(conn, invoice_data)
+        conn.close()
+        return [_verdict(report) for report in reports]
+
+    def _assert_agree(self, invoice_datas, history=()):
+        single = self._run_single(invoice_datas, history)
+        batch = self._run_batch(invoice_datas, history)
+        self.assertEqual(single, batch)
+        return single
+
+    def test_clean_invoice_is_not_its_own_duplicate(self):
+        verdicts = self._assert_agree([_invoice("INV-001")])
+        self.assertEqual(verdicts[0][:2], ([], 0))
+
+    def test_duplicate_within_batch_is_flagged_like_sequential_runs(self):
+        verdicts = self._assert_agree([_invoice("INV-001"), _invoice("INV-001")])
+        self.assertEqual(verdicts[0][1], 0)
+        self.assertIn('exact_duplicate', verdicts[1][0])
+
+    def test_resubmitted_invoice_is_flagged_in_both_paths(self):
+        verdicts = self._assert_agree([_invoice("INV-001")], history=[_invoice("INV-001")])
+        self.assertIn('exact_duplicate', verdicts[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()